@@ -0,0 +1,416 @@
+"""End-to-end load test of main.app without Gemini or PostgreSQL.
+
+genai.GenerativeModel is replaced by a deterministic fake with configurable
+latency, and db.connection by connections to a generated SQLite database
+that answer the catalog and EXPLAIN queries the app issues. Requests go
+through the real FastAPI routes over httpx's ASGI transport, so routing,
+the SQL cache, schema pruning, the SQL guard, result streaming and
+summarization all run as in production. For every endpoint the run reports
+p50/p95/p99 latency and throughput; --json saves them and --compare prints
+the change against a saved run.
+
+    python benchmarks/bench_app.py --requests 200 --concurrency 16 --json before.json
+    python benchmarks/bench_app.py --requests 200 --concurrency 16 --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+import warnings
+from contextlib import contextmanager
+from datetime import date, timedelta
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep background jobs and the real database out of the run; these must be
+# set before the app modules read them
+os.environ["REVENUE_MONITOR_ENABLED"] = "false"
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.pop("SQL_CACHE_PATH", None)
+
+SCHEMA = """
+CREATE TABLE regions (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, segment TEXT,
+                        region_id INTEGER REFERENCES regions(id));
+CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, category TEXT, price REAL);
+CREATE TABLE orders (id INTEGER PRIMARY KEY, order_date TEXT, quantity INTEGER, amount REAL,
+                     customer_id INTEGER REFERENCES customers(id),
+                     product_id INTEGER REFERENCES products(id));
+"""
+
+# SQL the fake model answers with; the question text picks one deterministically
+TABLE_QUERIES = [
+    "SELECT r.name AS region, SUM(o.amount) AS revenue FROM orders o "
+    "JOIN customers c ON c.id = o.customer_id JOIN regions r ON r.id = c.region_id "
+    "GROUP BY r.name ORDER BY revenue DESC",
+    "SELECT p.category, COUNT(*) AS order_count, SUM(o.quantity) AS units FROM orders o "
+    "JOIN products p ON p.id = o.product_id GROUP BY p.category",
+    "SELECT c.name, SUM(o.amount) AS total FROM orders o JOIN customers c ON c.id = o.customer_id "
+    "GROUP BY c.name ORDER BY total DESC LIMIT 50",
+    "SELECT id, order_date, amount FROM orders WHERE amount > 900 ORDER BY amount DESC",
+]
+CHART_QUERIES = [
+    "SELECT order_date, SUM(amount) AS revenue FROM orders GROUP BY order_date ORDER BY order_date",
+    "SELECT p.category, SUM(o.amount) AS revenue FROM orders o JOIN products p ON p.id = o.product_id "
+    "GROUP BY p.category",
+]
+SUBJECTS = ["revenue", "orders", "customers", "products", "units sold", "average order value"]
+GROUPINGS = ["by region", "by category", "by customer", "per day", "per segment", "for top customers"]
+PERIODS = ["last month", "this year", "in 2024", "last quarter", "this week"]
+
+
+def build_database(path, orders, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO regions VALUES (?, ?)",
+                     [(i, name) for i, name in enumerate(["North", "South", "East", "West", "Central"])])
+    conn.executemany("INSERT INTO customers VALUES (?, ?, ?, ?)",
+                     [(i, f"Customer {i}", rng.choice(["retail", "smb", "enterprise"]), rng.randrange(5))
+                      for i in range(2000)])
+    conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?)",
+                     [(i, f"Product {i}", rng.choice(["books", "games", "tools", "garden", "music"]),
+                       round(rng.uniform(1, 200), 2)) for i in range(500)])
+    start = date(2024, 1, 1)
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?)",
+                     [(i, (start + timedelta(days=rng.randrange(365))).isoformat(), rng.randint(1, 5),
+                       round(rng.uniform(5, 1000), 2), rng.randrange(2000), rng.randrange(500))
+                      for i in range(orders)])
+    conn.commit()
+    conn.close()
+
+
+class FakeCursor:
+    """The parts of a psycopg2 cursor the app uses, on top of SQLite"""
+
+    def __init__(self, conn, latency):
+        self._conn = conn
+        self._latency = latency
+        self._cursor = None
+        self._rows = None
+        self.description = None
+        self.closed = False
+        self.itersize = 2000
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def execute(self, sql, params=None):
+        import schema_catalog
+        if self._latency:
+            time.sleep(self._latency)
+        if sql.startswith("SET LOCAL"):
+            self._rows = []
+        elif sql.startswith("EXPLAIN"):
+            self._rows = [([{"Plan": {"Total Cost": 1000.0, "Plan Rows": 1000}}],)]
+        elif sql == schema_catalog.VERSION_QUERY:
+            ddl = "".join(r[0] or "" for r in self._conn.execute("SELECT sql FROM sqlite_master ORDER BY name"))
+            self._rows = [(hashlib.md5(ddl.encode()).hexdigest(),)]
+        elif sql == schema_catalog.CATALOG_QUERY:
+            self._rows = [(table, column, ctype.lower() or "text", None, None)
+                          for table in self._tables()
+                          for _, column, ctype, *_ in self._conn.execute(f"PRAGMA table_info({table})")]
+        elif sql == schema_catalog.FOREIGN_KEY_QUERY:
+            self._rows = [(table, fk[3], fk[2], fk[4]) for table in self._tables()
+                          for fk in self._conn.execute(f"PRAGMA foreign_key_list({table})")]
+        else:
+            self._cursor = self._conn.execute(sql)
+            self.description = self._cursor.description
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size):
+        if self._cursor is not None:
+            return self._cursor.fetchmany(size)
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self._rows)) if self._cursor is None else self._cursor.fetchall()
+
+    def close(self):
+        self.closed = True
+
+    def _tables(self):
+        return [r[0] for r in self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+
+
+class FakeConnection:
+    def __init__(self, conn, latency):
+        self._conn = conn
+        self._latency = latency
+        self.closed = False
+
+    def cursor(self, name=None):
+        return FakeCursor(self._conn, self._latency)
+
+    def cancel(self):
+        self._conn.interrupt()
+
+
+class FakeDatabase:
+    """Stand-in for db.connection: a bounded set of SQLite connections"""
+
+    def __init__(self, path, pool_size, latency):
+        self._free = [sqlite3.connect(path, check_same_thread=False) for _ in range(pool_size)]
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._latency = latency
+
+    @contextmanager
+    def connection(self, readonly=False, timeout_ms=None):
+        self._slots.acquire()
+        with self._lock:
+            conn = self._free.pop()
+        try:
+            yield FakeConnection(conn, self._latency)
+        finally:
+            with self._lock:
+                self._free.append(conn)
+            self._slots.release()
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Deterministic stand-in for genai.GenerativeModel.
+
+    Latency per call is drawn from a seeded log-normal around the configured
+    mean, so a run is repeatable; answers depend only on the prompt.
+    """
+
+    latency = 0.3
+    jitter = 0.3
+    seed = 0
+    _rng = None
+    _rng_lock = threading.Lock()
+
+    def __init__(self, model_name=None, **kwargs):
+        self.model_name = model_name
+
+    @classmethod
+    def _delay(cls):
+        with cls._rng_lock:
+            if cls._rng is None:
+                cls._rng = random.Random(cls.seed)
+            factor = cls._rng.lognormvariate(0, cls.jitter) if cls.jitter else 1.0
+        return cls.latency * factor
+
+    @staticmethod
+    def _answer(prompt):
+        if "New Query:" in prompt:
+            question = prompt.rsplit("Q:", 1)[1]
+            digest = int(hashlib.md5(question.encode()).hexdigest(), 16)
+            queries = CHART_QUERIES if "CHART REQUEST" in prompt else TABLE_QUERIES
+            return f"```sql\n{queries[digest % len(queries)]}\n```"
+        return ("Revenue is concentrated in a few groups; the largest accounts for about a quarter "
+                "of the total and the smallest for under a tenth. ") * 3
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        delay = self._delay()
+        text = self._answer(prompt)
+        if not stream:
+            await asyncio.sleep(delay)
+            return FakeResponse(text)
+
+        async def chunks():
+            pieces = [text[i:i + 40] for i in range(0, len(text), 40)]
+            for piece in pieces:
+                await asyncio.sleep(delay / len(pieces))
+                yield FakeResponse(piece)
+        return chunks()
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(self._delay())
+        return FakeResponse(self._answer(prompt))
+
+
+def make_questions(n, distinct, seed):
+    rng = random.Random(seed)
+    pool = [f"Show {rng.choice(SUBJECTS)} {rng.choice(GROUPINGS)} {rng.choice(PERIODS)} #{i}"
+            for i in range(distinct)]
+    return [rng.choice(pool) for _ in range(n)]
+
+
+def make_dataset(i, examples):
+    return json.dumps({
+        "natural_language": [f"Upload {i} question {j} about orders" for j in range(examples)],
+        "sql": [f"SELECT * FROM orders WHERE id = {j}" for j in range(examples)],
+    }).encode()
+
+
+async def call_chat(client, question):
+    r = await client.post("/chat", json={"messages": [{"role": "user", "content": question}]})
+    return r.status_code == 200 and not r.json().get("error")
+
+
+async def call_chart(client, question):
+    r = await client.post("/chat", json={"messages": [{"role": "user", "content": f"{question} chart"}]})
+    return r.status_code == 200 and not r.json().get("error")
+
+
+async def call_stream(client, question):
+    types = set()
+    async with client.stream("POST", "/chat/stream",
+                             json={"messages": [{"role": "user", "content": question}]}) as r:
+        async for line in r.aiter_lines():
+            if line:
+                types.add(json.loads(line)["type"])
+    return "done" in types and "error" not in types
+
+
+async def call_batch(client, questions):
+    r = await client.post("/chat/batch", json={"questions": questions})
+    return r.status_code == 200 and not any(item["error"] for item in r.json()["results"])
+
+
+async def call_upload(client, payload):
+    r = await client.post("/upload-dataset", files={"file": ("dataset.json", payload, "application/json")})
+    result = r.json()
+    while result.get("job_id") and result.get("status") not in ("success", "exists", "failed"):
+        await asyncio.sleep(0.01)
+        result = (await client.get(f"/upload-dataset/{result['job_id']}")).json()
+    return result.get("status") in ("success", "exists")
+
+
+async def run_endpoint(client, call, inputs, concurrency):
+    latencies = []
+    failures = 0
+    queue = iter(inputs)
+
+    async def worker():
+        nonlocal failures
+        for item in queue:
+            start = time.perf_counter()
+            try:
+                ok = await call(client, item)
+            except Exception as e:
+                print(f"  request failed: {e}")
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            failures += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "failures": failures,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "throughput_rps": len(latencies) / wall,
+    }
+
+
+def print_results(results, baseline=None):
+    print(f"{'endpoint':<10} {'reqs':>5} {'fail':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for name, r in results.items():
+        line = (f"{name:<10} {r['requests']:>5} {r['failures']:>4} {r['p50_ms']:>9.1f} "
+                f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['throughput_rps']:>8.1f}")
+        base = (baseline or {}).get(name)
+        if base:
+            changes = [(r[k] - base[k]) / base[k] * 100 if base[k] else 0.0
+                       for k in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")]
+            line += "   vs baseline (p50/p95/p99/req/s): " + " ".join(f"{c:+.1f}%" for c in changes)
+        print(line)
+
+
+async def run(args):
+    warnings.filterwarnings("ignore", category=FutureWarning)
+    import google.generativeai as genai
+    FakeModel.latency = args.llm_latency
+    FakeModel.jitter = args.llm_jitter
+    FakeModel.seed = args.seed
+    genai.GenerativeModel = FakeModel
+
+    workdir = tempfile.mkdtemp(prefix="bench_app_")
+    database = os.path.join(workdir, "warehouse.db")
+    build_database(database, args.orders, args.seed)
+    # The app keeps uploads and training examples relative to the working directory
+    os.chdir(workdir)
+
+    import db
+    fake_db = FakeDatabase(database, args.pool_size, args.db_latency)
+    db.connection = fake_db.connection
+    db.init_pool = db.close_pool = lambda: None
+
+    import httpx
+    import main
+    main.add_training_examples([f"Show revenue by region example {i}" for i in range(200)],
+                               [TABLE_QUERIES[0]] * 200)
+
+    questions = make_questions(args.requests * args.batch_size, args.distinct, args.seed)
+    scenarios = {
+        "chat": (call_chat, questions[:args.requests]),
+        "chart": (call_chart, questions[:args.requests]),
+        "stream": (call_stream, questions[:args.requests]),
+        "batch": (call_batch, [questions[i:i + args.batch_size]
+                               for i in range(0, args.requests * args.batch_size, args.batch_size)]),
+        "upload": (call_upload, [make_dataset(i, args.upload_examples) for i in range(args.requests)]),
+    }
+    selected = args.endpoints or list(scenarios)
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name in selected:
+            call, inputs = scenarios[name]
+            # Cached SQL from an earlier scenario would flatter the later ones
+            main.sql_cache.clear()
+            results[name] = await run_endpoint(client, call, inputs, args.concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--endpoints", nargs="*", choices=["chat", "chart", "stream", "batch", "upload"])
+    parser.add_argument("--distinct", type=int, default=50, help="distinct questions in the pool")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--upload-examples", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=50_000)
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="mean seconds per model call")
+    parser.add_argument("--llm-jitter", type=float, default=0.3, help="log-normal sigma of model latency")
+    parser.add_argument("--db-latency", type=float, default=0.001, help="seconds added per statement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results file to compare against")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    results = asyncio.run(run(args))
+    print_results(results, baseline)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Cost of the chart-data pipeline on large query results.
+
+Rows are fed to ChartSeries in the same batch size the server-side cursor
+uses. The run reports the time to build the columnar arrays, the time to
+downsample them, and the resulting payload size for the common result shapes.
+
+    python benchmarks/bench_chart_data.py --rows 1000000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chart_data import ChartSeries, CHART_TARGET_POINTS
+from db import DB_FETCH_SIZE
+
+
+def ordered_dates(n, rng):
+    start = date(2000, 1, 1)
+    return [(start + timedelta(days=i // 24), Decimal(rng.randint(0, 10000)) / 100) for i in range(n)]
+
+
+def ordered_timestamps(n, rng):
+    start = datetime(2024, 1, 1)
+    return [(start + timedelta(seconds=i), rng.random() * 100) for i in range(n)]
+
+
+def unordered_numbers(n, rng):
+    return [(rng.random() * 1000, rng.gauss(50, 10)) for _ in range(n)]
+
+
+def categories(n, rng):
+    return [(f"product_{i}", rng.randint(1, 5000)) for i in range(n)]
+
+
+SHAPES = {
+    "ordered dates": ordered_dates,
+    "ordered timestamps": ordered_timestamps,
+    "unordered numbers": unordered_numbers,
+    "categories": categories,
+}
+
+
+def run(name, rows, target):
+    start = time.perf_counter()
+    series = ChartSeries()
+    for i in range(0, len(rows), DB_FETCH_SIZE):
+        series.add(rows[i:i + DB_FETCH_SIZE])
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chart = series.to_chart(["x", "y"], target)
+    reduce = time.perf_counter() - start
+
+    payload = len(json.dumps(chart))
+    print(f"{name:<20} | {chart['original_points']:>9} -> {chart['points']:>5} pts ({chart['method']:<8}) | "
+          f"columnar {build:6.2f}s | downsample {reduce * 1000:7.1f}ms | payload {payload / 1024:7.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--target", type=int, default=CHART_TARGET_POINTS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, make_rows in SHAPES.items():
+        rows = make_rows(args.rows, random.Random(args.seed))
+        run(name, rows, args.target)
+
+
+if __name__ == "__main__":
+    main()
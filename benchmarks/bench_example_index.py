@@ -0,0 +1,116 @@
+"""Retrieval quality and latency of ExampleIndex on synthetic training sets.
+
+Each corpus is generated from question templates over random tables,
+metrics and filters. Queries are paraphrases of stored questions (synonym
+swaps and dropped words). A query counts as a hit when an example with the
+same template and slots comes back in the top k.
+
+    python benchmarks/bench_example_index.py --sizes 10000 100000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from example_index import ExampleIndex
+
+ENTITIES = ["customers", "orders", "products", "employees", "suppliers", "invoices",
+            "shipments", "payments", "categories", "stores", "regions", "returns"]
+METRICS = ["revenue", "quantity", "discount", "price", "profit", "tax", "cost", "rating"]
+FILTERS = ["in 2023", "last month", "in New York", "in California", "for the Electronics category",
+           "over $1000", "this quarter", "by premium members", "with free shipping", "in Europe"]
+TEMPLATES = [
+    "Show total {metric} of {entity} {filter}",
+    "List the top {n} {entity} by {metric} {filter}",
+    "Count the number of {entity} {filter}",
+    "Show average {metric} per {entity} {filter}",
+    "Find {entity} with the lowest {metric} {filter}",
+    "Show a chart of {metric} by {entity} {filter}",
+]
+SYNONYMS = {
+    "Show": ["Display", "Give me", "What is"],
+    "List": ["Show", "Give me"],
+    "Count": ["How many", "Number of"],
+    "total": ["overall", "sum of"],
+    "average": ["mean", "avg"],
+    "lowest": ["smallest", "minimum"],
+    "chart": ["graph", "plot"],
+}
+
+
+def make_corpus(size, rng):
+    questions, labels = [], []
+    for _ in range(size):
+        template = rng.randrange(len(TEMPLATES))
+        slots = {
+            "entity": rng.choice(ENTITIES),
+            "metric": rng.choice(METRICS),
+            "filter": rng.choice(FILTERS),
+            "n": rng.choice([3, 5, 10]),
+        }
+        questions.append(TEMPLATES[template].format(**slots))
+        labels.append((template, slots["entity"], slots["metric"], slots["filter"]))
+    return questions, labels
+
+
+def paraphrase(question, rng):
+    words = question.split()
+    out = []
+    for word in words:
+        if word in SYNONYMS and rng.random() < 0.7:
+            out.append(rng.choice(SYNONYMS[word]))
+        elif rng.random() < 0.1:
+            continue
+        else:
+            out.append(word)
+    return " ".join(out)
+
+
+def run(size, queries, k, seed):
+    rng = random.Random(seed)
+    questions, labels = make_corpus(size, rng)
+
+    index = ExampleIndex()
+    start = time.perf_counter()
+    for i in range(0, size, 1000):
+        index.add(questions[i:i + 1000])
+    build = time.perf_counter() - start
+
+    # Warm the posting arrays the way a long-running server would
+    index.search(questions[0], k)
+
+    latencies = []
+    hits_at_1 = hits_at_k = 0
+    for _ in range(queries):
+        source = rng.randrange(size)
+        query = paraphrase(questions[source], rng)
+        start = time.perf_counter()
+        ids = index.search(query, k)
+        latencies.append(time.perf_counter() - start)
+        relevant = [labels[i] == labels[source] for i in ids]
+        hits_at_1 += bool(relevant[:1] and relevant[0])
+        hits_at_k += any(relevant)
+
+    latencies = np.array(latencies) * 1000
+    print(f"{size:>8} examples | build {build:6.2f}s | "
+          f"search p50 {np.percentile(latencies, 50):.3f}ms p99 {np.percentile(latencies, 99):.3f}ms | "
+          f"recall@1 {hits_at_1 / queries:.3f} recall@{k} {hits_at_k / queries:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.queries, args.k, args.seed)
+
+
+if __name__ == "__main__":
+    main()
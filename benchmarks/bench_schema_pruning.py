@@ -0,0 +1,139 @@
+"""Schema pruning on a synthetic warehouse schema.
+
+The schema has shared dimension tables and fact tables spread over business
+domains, each fact referencing a few dimensions, with comments on a share of
+tables and columns. Every question is built from one fact table, one of its
+measures and one of its dimensions, so the tables it needs are known; one
+template leaves out the domain and is ambiguous on purpose. The run reports
+how often the schema was pruned, how often pruning kept every needed table,
+and the prompt tokens saved against sending the full schema.
+
+    python benchmarks/bench_schema_pruning.py --tables 500 --questions 2000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema_catalog import render_schema
+from schema_index import SchemaIndex
+from summarize import estimate_tokens
+
+DIMENSIONS = ["customer", "product", "store", "region", "employee", "supplier", "warehouse",
+              "currency", "channel", "campaign", "vendor", "carrier", "department", "account",
+              "category", "brand", "country", "city", "device", "partner"]
+DOMAINS = ["sales", "hr", "inventory", "finance", "marketing", "support", "logistics",
+           "procurement", "billing", "web", "mobile", "retail", "payroll", "compliance",
+           "risk", "loyalty", "pricing", "forecast", "audit", "crm"]
+EVENTS = ["order", "return", "shipment", "invoice", "payment", "refund", "visit", "ticket",
+          "claim", "adjustment", "transfer", "booking", "subscription", "quote", "lead",
+          "session", "review", "survey", "contract", "delivery", "receipt", "allocation",
+          "reservation", "cancellation", "settlement"]
+MEASURES = ["amount", "quantity", "discount", "revenue", "cost", "margin", "tax", "duration",
+            "weight", "score", "fee", "balance", "volume", "price", "rating", "commission"]
+ATTRIBUTES = ["name", "code", "status", "type", "description", "created_at", "updated_at", "email",
+              "phone", "address", "segment", "tier", "active"]
+
+
+def make_schema(n_tables, rng):
+    tables, comments, foreign_keys, facts = {}, {}, {}, []
+    for dim in DIMENSIONS:
+        name = f"{dim}s"
+        tables[name] = [("id", "integer")] + [(f"{dim}_{a}" if a in ("name", "code") else a, "text")
+                                              for a in rng.sample(ATTRIBUTES, 5)]
+        comments[name] = f"One row per {dim}"
+
+    pairs = [(d, e) for d in DOMAINS for e in EVENTS]
+    rng.shuffle(pairs)
+    for domain, event in pairs[:n_tables - len(DIMENSIONS)]:
+        name = f"{domain}_{event}s"
+        dims = rng.sample(DIMENSIONS, rng.randint(2, 4))
+        measures = rng.sample(MEASURES, rng.randint(2, 4))
+        columns = [("id", "bigint"), (f"{event}_date", "date")]
+        for dim in dims:
+            columns.append((f"{dim}_id", "integer"))
+            foreign_keys[(name, f"{dim}_id")] = (f"{dim}s", "id")
+        for measure in measures:
+            columns.append((f"{measure}", "numeric"))
+            if rng.random() < 0.3:
+                comments[(name, measure)] = f"{measure.capitalize()} in the {domain} currency"
+        columns += [(a, "text") for a in rng.sample(ATTRIBUTES, 3)]
+        tables[name] = columns
+        if rng.random() < 0.5:
+            comments[name] = f"{domain.capitalize()} {event} events"
+        facts.append((name, domain, event, dims, measures))
+    return tables, comments, foreign_keys, facts
+
+
+QUESTIONS = [
+    "Total {measure} of {domain} {event}s by {dim}",
+    "Show {domain} {event} {measure} per {dim} last month",
+    "Which {dim} has the highest {measure} in {domain} {event}s?",
+    "Average {measure} for {domain} {event}s grouped by {dim} this year",
+    "Top 10 {dim}s by {domain} {event} {measure}",
+    # No domain: several fact tables fit, so the schema should not be pruned
+    "How many {event}s per {dim}?",
+]
+
+
+def make_questions(facts, n, rng):
+    questions = []
+    for _ in range(n):
+        name, domain, event, dims, measures = rng.choice(facts)
+        dim = rng.choice(dims)
+        text = rng.choice(QUESTIONS).format(measure=rng.choice(measures), domain=domain,
+                                            event=event, dim=dim)
+        questions.append((text, {name, f"{dim}s"}))
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, default=500)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tables, comments, foreign_keys, facts = make_schema(args.tables, rng)
+    full_text = render_schema(tables, comments, foreign_keys)
+    full_tokens = estimate_tokens(full_text)
+
+    start = time.perf_counter()
+    index = SchemaIndex(tables, comments, foreign_keys)
+    build = time.perf_counter() - start
+
+    pruned = complete = 0
+    selected_tables, prompt_tokens, latencies = [], [], []
+    for question, needed in make_questions(facts, args.questions, rng):
+        start = time.perf_counter()
+        selected = index.select(question)
+        latencies.append(time.perf_counter() - start)
+        if selected is None:
+            prompt_tokens.append(full_tokens)
+            continue
+        pruned += 1
+        complete += needed <= set(selected)
+        selected_tables.append(len(selected))
+        prompt_tokens.append(estimate_tokens(render_schema({t: tables[t] for t in selected},
+                                                           comments, foreign_keys)))
+
+    latencies = np.array(latencies) * 1000
+    n = args.questions
+    print(f"schema: {len(tables)} tables, {sum(map(len, tables.values()))} columns, "
+          f"{len(foreign_keys)} foreign keys, ~{full_tokens} tokens; index built in {build * 1000:.1f}ms")
+    print(f"pruned {pruned}/{n} questions ({pruned / n:.1%}), full schema for {n - pruned}")
+    if pruned:
+        print(f"needed tables kept in {complete}/{pruned} pruned prompts ({complete / pruned:.1%}), "
+              f"{np.mean(selected_tables):.1f} tables on average")
+    print(f"schema tokens per prompt: mean {np.mean(prompt_tokens):.0f} vs {full_tokens} full, "
+          f"~{full_tokens - np.mean(prompt_tokens):.0f} saved ({1 - np.mean(prompt_tokens) / full_tokens:.1%})")
+    print(f"select latency: p50 {np.percentile(latencies, 50):.3f}ms  p99 {np.percentile(latencies, 99):.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
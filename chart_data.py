@@ -0,0 +1,206 @@
+import os
+from datetime import date, datetime
+from decimal import Decimal
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Maximum number of points sent to the browser for one chart
+CHART_TARGET_POINTS = int(os.getenv("CHART_TARGET_POINTS", "1000"))
+
+
+def _kind(values):
+    """Plotting type of a column from its first non-null value, or None if all null"""
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return "category"
+        if isinstance(value, (int, float, Decimal)):
+            return "number"
+        if isinstance(value, datetime):
+            return "datetime"
+        if isinstance(value, date):
+            return "date"
+        return "category"
+    return None
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_DAY_US = 86_400_000_000
+_NAT = np.iinfo(np.int64).min
+
+
+def _date_us(value):
+    return (value.toordinal() - _EPOCH_ORDINAL) * _DAY_US
+
+
+def _datetime_us(value):
+    seconds = (value.hour * 60 + value.minute) * 60 + value.second
+    return (value.toordinal() - _EPOCH_ORDINAL) * _DAY_US + seconds * 1_000_000 + value.microsecond
+
+
+def _to_float(values):
+    try:
+        # NumPy maps None to NaN and converts int/float/Decimal itself
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    out = np.empty(len(values), dtype=np.float64)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value) if value is not None else np.nan
+        except (TypeError, ValueError):
+            out[i] = np.nan
+    return out
+
+
+def _convert_x(values, kind):
+    if kind == "number":
+        return _to_float(values)
+    if kind in ("date", "datetime"):
+        # Integer arithmetic on ordinals is far cheaper than NumPy parsing date objects;
+        # timezone-aware values are plotted in their own offset
+        to_us = _date_us if kind == "date" else _datetime_us
+        micros = np.fromiter((_NAT if v is None else to_us(v) for v in values),
+                             dtype=np.int64, count=len(values))
+        return micros.view("datetime64[us]")
+    return np.array(["" if v is None else str(v) for v in values], dtype=object)
+
+
+class ChartSeries:
+    """First two result columns accumulated batch by batch as NumPy arrays"""
+
+    def __init__(self):
+        self.kind = None
+        self._x = []
+        self._y = []
+        self._leading_nulls = 0
+
+    def add(self, rows):
+        if not rows:
+            return
+        xs = [row[0] for row in rows]
+        if self.kind is None:
+            self.kind = _kind(xs)
+            if self.kind is None:
+                # Type still unknown; remember the null x values until it is
+                self._leading_nulls += len(xs)
+                self._y.append(_to_float([row[1] if len(row) > 1 else None for row in rows]))
+                return
+            if self._leading_nulls:
+                self._x.append(_convert_x([None] * self._leading_nulls, self.kind))
+        self._x.append(_convert_x(xs, self.kind))
+        self._y.append(_to_float([row[1] if len(row) > 1 else None for row in rows]))
+
+    def arrays(self):
+        if not self._x:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+        return np.concatenate(self._x), np.concatenate(self._y)
+
+    def to_chart(self, columns, target=CHART_TARGET_POINTS):
+        x, y = self.arrays()
+        chart = downsample(x, y, self.kind or "number", target)
+        chart["x_label"] = columns[0] if columns else "X Axis"
+        chart["y_label"] = columns[1] if len(columns) > 1 else "Y Axis"
+        return chart
+
+
+def lttb(x, y, target):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets on x-sorted data"""
+    n = len(x)
+    if target >= n or target < 3:
+        return np.arange(n)
+
+    # Bucket means come from prefix sums, so each bucket costs O(its size) once
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    edges = np.linspace(1, n - 1, target - 1).astype(np.int64)
+
+    keep = np.empty(target, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(target - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_end = max(next_end, next_start + 1)
+        avg_x = (cx[next_end] - cx[next_start]) / (next_end - next_start)
+        avg_y = (cy[next_end] - cy[next_start]) / (next_end - next_start)
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a])
+                      - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return np.unique(keep)
+
+
+def bin_means(x, y, target):
+    """Average y over target equal-width bins of x; returns (bin centres, means)"""
+    lo, hi = x.min(), x.max()
+    if hi == lo:
+        return np.array([lo]), np.array([y.mean()])
+    bins = np.minimum(((x - lo) / (hi - lo) * target).astype(np.int64), target - 1)
+    counts = np.bincount(bins, minlength=target)
+    sums = np.bincount(bins, weights=y, minlength=target)
+    filled = counts > 0
+    centres = lo + (np.arange(target) + 0.5) * (hi - lo) / target
+    return centres[filled], sums[filled] / counts[filled]
+
+
+def top_categories(x, y, target):
+    """Sum y per category, then keep the target-1 largest in first-seen order and the rest as Other"""
+    labels, first, inverse = np.unique(x, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    # np.unique sorts the labels; rank[i] is where label i lands in first-seen order
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    labels = labels[order]
+    totals = np.bincount(rank[inverse.ravel()], weights=y, minlength=len(labels))
+    if len(labels) <= target:
+        return labels, totals
+    kept = np.sort(np.argpartition(-totals, target - 2)[:target - 1])
+    other = totals.sum() - totals[kept].sum()
+    return np.append(labels[kept], "Other"), np.append(totals[kept], other)
+
+
+def downsample(x, y, kind, target=CHART_TARGET_POINTS):
+    """Reduce (x, y) to at most target points and describe how it was done"""
+    original = len(x)
+    if kind in ("number", "date", "datetime"):
+        valid = ~(np.isnan(x) if kind == "number" else np.isnat(x)) & ~np.isnan(y)
+    else:
+        valid = ~np.isnan(y)
+    if not valid.all():
+        x, y = x[valid], y[valid]
+
+    method = "none"
+    if len(x) > target:
+        if kind == "category":
+            x, y = top_categories(x, y, target)
+            method = "top_n"
+        else:
+            numeric_x = x.astype(np.int64).astype(np.float64) if kind != "number" else x
+            if np.all(numeric_x[1:] >= numeric_x[:-1]):
+                keep = lttb(numeric_x, y, target)
+                x, y = x[keep], y[keep]
+                method = "lttb"
+            else:
+                centres, y = bin_means(numeric_x, y, target)
+                x = centres.astype(np.int64).astype("datetime64[us]") if kind != "number" else centres
+                method = "bin_mean"
+
+    if kind == "date":
+        labels = np.datetime_as_string(x, unit="D").tolist()
+    elif kind == "datetime":
+        labels = np.datetime_as_string(x, unit="s").tolist()
+    else:
+        labels = x.tolist()
+
+    return {
+        "x": labels,
+        "y": y.tolist(),
+        "original_points": original,
+        "points": len(labels),
+        "method": method,
+    }
@@ -0,0 +1,52 @@
+import os
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Maximum number of in-flight operations per pipeline stage on one worker
+STAGE_LIMITS = {
+    "llm": int(os.getenv("LLM_CONCURRENCY", "8")),
+    "db": int(os.getenv("DB_CONCURRENCY", os.getenv("DB_POOL_MAX", "10"))),
+    "io": int(os.getenv("IO_CONCURRENCY", "4")),
+    # Query cancellation, kept apart so it never waits behind the query it stops
+    "cancel": int(os.getenv("CANCEL_CONCURRENCY", "2")),
+}
+
+_semaphores = {}
+_executors = {}
+
+
+def limiter(stage):
+    """Semaphore bounding concurrent work in the given stage"""
+    semaphore = _semaphores.get(stage)
+    if semaphore is None:
+        semaphore = _semaphores[stage] = asyncio.Semaphore(STAGE_LIMITS[stage])
+    return semaphore
+
+
+def executor(stage):
+    """Thread pool of the given stage, sized to its limit so stages cannot starve each other"""
+    pool = _executors.get(stage)
+    if pool is None:
+        pool = _executors[stage] = ThreadPoolExecutor(
+            max_workers=STAGE_LIMITS[stage], thread_name_prefix=f"{stage}-worker")
+    return pool
+
+
+async def run_blocking(stage, func, *args, **kwargs):
+    """Run a blocking call on the stage's worker threads without stalling the event loop"""
+    async with limiter(stage):
+        # Carry the context over, as asyncio.to_thread does, so metrics spans still land
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(executor(stage), call)
+
+
+def shutdown():
+    """Stop the stage thread pools; running calls are left to finish"""
+    for pool in _executors.values():
+        pool.shutdown(wait=False)
+    _executors.clear()
@@ -0,0 +1,316 @@
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+import itertools
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Examples written to the store per transaction while ingesting
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+# Largest single JSON item accepted; bounds the parser buffer on malformed input
+MAX_ITEM_SIZE = int(os.getenv("MAX_ITEM_SIZE", str(16 * 1024 * 1024)))
+# Finished jobs kept around for polling
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", "100"))
+
+_decoder = json.JSONDecoder()
+_SCALAR_END = re.compile(r"[,\]}\s]")
+_MISSING = object()
+
+
+class _JSONStream:
+    """Pull parser for the few top-level JSON shapes a dataset upload uses"""
+
+    def __init__(self, f, chunk_size=None):
+        self._f = f
+        self._chunk_size = chunk_size or UPLOAD_CHUNK_SIZE
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        data = self._f.read(self._chunk_size)
+        if not data:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, or "" at end of input"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Invalid JSON format: expected {char!r}, found {found!r}")
+        self._pos += 1
+
+    def value(self):
+        if self.peek() not in ('"', "[", "{"):
+            # Numbers and literals are only complete once a delimiter follows them
+            while not _SCALAR_END.search(self._buf, self._pos) and self._fill():
+                pass
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                if len(self._buf) - self._pos < MAX_ITEM_SIZE and self._fill():
+                    continue
+                raise ValueError(f"Invalid JSON format: {e.msg}") from e
+            self._pos = end
+            return obj
+
+    def iter_array(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self._pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError("Invalid JSON format: expected ',' or ']'")
+
+    def iter_keys(self):
+        """Yield the keys of an object; the caller reads or skips each value before resuming"""
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise ValueError("Invalid JSON format: expected a key")
+            name = self.value()
+            self.expect(":")
+            yield name
+            char = self.peek()
+            self._pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError("Invalid JSON format: expected ',' or '}'")
+
+    def skip_value(self):
+        char = self.peek()
+        if char == "[":
+            for _ in self.iter_array():
+                pass
+        elif char == "{":
+            for _ in self.iter_keys():
+                self.skip_value()
+        else:
+            self.value()
+
+
+def iter_column(path, key, check_end=False):
+    """Stream the string items of the top-level array stored under key.
+
+    With check_end, the rest of the document after the array is read too and
+    must close the top-level object and end the file.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        stream = _JSONStream(f)
+        keys = stream.iter_keys()
+        for name in keys:
+            if name == key:
+                break
+            stream.skip_value()
+        else:
+            raise ValueError(f"Missing key: {key}")
+        for item in stream.iter_array():
+            if not isinstance(item, str):
+                raise ValueError(f"Invalid dataset: {key} must contain only strings")
+            yield item
+        if check_end:
+            for _ in keys:
+                stream.skip_value()
+            if stream.peek():
+                raise ValueError("Invalid JSON format: extra data after the dataset")
+
+
+def iter_examples(path):
+    """Stream (question, sql) pairs from a {"natural_language": [...], "sql": [...]} file.
+
+    The two arrays are read through independent file handles, so memory use
+    does not depend on how large either of them is. The sql pass reads the
+    whole document, so malformed JSON fails here as it would with
+    json.loads, and so do arrays of different lengths.
+    """
+    questions = iter_column(path, "natural_language")
+    queries = iter_column(path, "sql", check_end=True)
+    for nl, sql in itertools.zip_longest(questions, queries, fillvalue=_MISSING):
+        if nl is _MISSING or sql is _MISSING:
+            raise ValueError("Invalid dataset: natural_language and sql must have the same length")
+        yield nl, sql
+
+
+def iter_batches(pairs, size=INGEST_BATCH_SIZE):
+    nl_batch, sql_batch = [], []
+    for nl, sql in pairs:
+        nl_batch.append(nl)
+        sql_batch.append(sql)
+        if len(nl_batch) >= size:
+            yield nl_batch, sql_batch
+            nl_batch, sql_batch = [], []
+    if nl_batch:
+        yield nl_batch, sql_batch
+
+
+def dataset_hash(path):
+    """Hash of the parsed examples, independent of formatting; returns (hash, count)"""
+    digest = hashlib.sha256()
+    count = 0
+    for pair in iter_examples(path):
+        digest.update(json.dumps(pair, ensure_ascii=False).encode())
+        digest.update(b"\n")
+        count += 1
+    return digest.hexdigest(), count
+
+
+class UploadIndex:
+    """Persistent map from upload hashes to the stored dataset file"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                content_hash TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                examples INTEGER NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        # Every byte layout seen for a dataset, so re-sent files skip parsing entirely
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS raw_hashes (
+                raw_hash TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def find_raw(self, raw_hash):
+        """Stored filename for byte-identical content, if any"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT u.filename FROM raw_hashes r JOIN uploads u USING (content_hash)"
+                " WHERE r.raw_hash = ?", (raw_hash,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def find(self, content_hash):
+        """Stored filename for the same examples in any formatting, if any"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename FROM uploads WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record(self, content_hash, raw_hash, filename, examples):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO uploads VALUES (?, ?, ?, ?)",
+                (content_hash, filename, examples, time.time()),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO raw_hashes VALUES (?, ?)", (raw_hash, content_hash)
+            )
+            self._conn.commit()
+
+    def forget(self, filename):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM raw_hashes WHERE content_hash IN"
+                " (SELECT content_hash FROM uploads WHERE filename = ?)", (filename,)
+            )
+            self._conn.execute("DELETE FROM uploads WHERE filename = ?", (filename,))
+            self._conn.commit()
+
+
+class IngestJobs:
+    """In-process registry of dataset ingestion jobs and their progress"""
+
+    def __init__(self, max_finished=MAX_FINISHED_JOBS):
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, **fields):
+        job_id = uuid.uuid4().hex
+        job = {"job_id": job_id, "status": "queued", "processed": 0, "added": 0,
+               "total": None, "file": None, "error": None, "created": time.time()}
+        job.update(fields)
+        with self._lock:
+            self._jobs[job_id] = job
+            self._prune()
+        return job_id
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job["status"] in ("success", "exists", "failed")]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+
+
+def ingest_dataset(jobs, job_id, staged_path, raw_hash, upload_index, add_examples, uploads_dir):
+    """Hash, deduplicate and load a staged upload into the example store"""
+    try:
+        jobs.update(job_id, status="hashing")
+        content_hash, total = dataset_hash(staged_path)
+        jobs.update(job_id, total=total)
+
+        existing = upload_index.find(content_hash)
+        if existing:
+            os.remove(staged_path)
+            # Remember this byte layout so the next identical upload is rejected up front
+            upload_index.record(content_hash, raw_hash, existing, total)
+            jobs.update(job_id, status="exists", file=existing)
+            return
+
+        filename = f"dataset_{content_hash[:8]}.json"
+        filepath = os.path.join(uploads_dir, filename)
+        os.replace(staged_path, filepath)
+        jobs.update(job_id, status="ingesting", file=filename)
+
+        processed = added = 0
+        for nl_batch, sql_batch in iter_batches(iter_examples(filepath)):
+            added += add_examples(nl_batch, sql_batch)
+            processed += len(nl_batch)
+            jobs.update(job_id, processed=processed, added=added)
+
+        upload_index.record(content_hash, raw_hash, filename, total)
+        jobs.update(job_id, status="success")
+    except Exception as e:
+        print(f"Ingestion error: {e}")
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+        jobs.update(job_id, status="failed", error=str(e))
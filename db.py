@@ -0,0 +1,272 @@
+import os
+import sys
+import time
+import uuid
+import threading
+from collections import deque
+from contextlib import contextmanager, ExitStack
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Connections opened up front; idle connections are kept up to DB_POOL_MAX
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Server-side limit applied to every statement (0 disables it)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+# Connections idle for longer than this are pinged before being handed out
+DB_HEALTHCHECK_INTERVAL = float(os.getenv("DB_HEALTHCHECK_INTERVAL", "30"))
+# Rows pulled from a server-side cursor per round trip
+DB_FETCH_SIZE = int(os.getenv("DB_FETCH_SIZE", "2000"))
+
+
+class ConnectionPool:
+    """Thread-safe PostgreSQL pool that blocks when exhausted and drops dead connections.
+
+    At most maxconn connections are checked out at once, guarded by _slots,
+    and every healthy connection that comes back is kept idle for reuse.
+    """
+
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 statement_timeout_ms=DB_STATEMENT_TIMEOUT_MS,
+                 healthcheck_interval=DB_HEALTHCHECK_INTERVAL):
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._slots = threading.BoundedSemaphore(maxconn)
+        # (connection, time it was returned); the most recently used is reused first
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._params = dict(
+            host=os.getenv("DB_HOST"),
+            database=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            port=os.getenv("DB_PORT"),
+            options=f"-c statement_timeout={statement_timeout_ms}",
+        )
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    @contextmanager
+    def connection(self, readonly=False, timeout_ms=None):
+        """Check out a connection for one transaction; commits on success, rolls back on error"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(f"no database connection available after {self.timeout}s")
+        conn = None
+        try:
+            conn = self._checkout()
+            if conn.readonly != readonly:
+                conn.readonly = readonly
+            if timeout_ms is not None:
+                with conn.cursor() as cur:
+                    cur.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms),))
+            yield conn
+            conn.commit()
+        except BaseException:
+            if conn is not None and not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            if conn is not None:
+                self._release(conn)
+            self._slots.release()
+
+    def close(self):
+        """Close the idle connections; ones still checked out are closed when returned"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def _connect(self):
+        return psycopg2.connect(**self._params)
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if not self._idle:
+                    break
+                conn, last_used = self._idle.pop()
+            stale = time.monotonic() - last_used > self.healthcheck_interval
+            if not conn.closed and not (stale and not self._ping(conn)):
+                return conn
+            self._discard(conn)
+        return self._connect()
+
+    def _ping(self, conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _release(self, conn):
+        status = conn.info.transaction_status if not conn.closed else None
+        if status is None or status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            self._discard(conn)
+            return
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn)
+                return
+        with self._lock:
+            if not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                return
+        self._discard(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pool():
+    """Create the shared pool; safe to call more than once"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@contextmanager
+def connection(readonly=False, timeout_ms=None):
+    """Borrow a pooled connection, creating the pool on first use"""
+    pool = _pool or init_pool()
+    with pool.connection(readonly=readonly, timeout_ms=timeout_ms) as conn:
+        yield conn
+
+
+class ServerCursor:
+    """Read-only query on a named (server-side) cursor, fetched in bounded batches.
+
+    Only one batch is held in memory at a time. open(), fetch() and close()
+    are plain blocking calls so they can each be run on a worker thread;
+    cancel() may be called from any other thread.
+
+    prepare(conn, sql_query), if given, runs on the checked-out connection
+    before the cursor is declared and returns the SQL to execute instead.
+    """
+
+    def __init__(self, sql_query, batch_size=DB_FETCH_SIZE, max_rows=None, timeout_ms=None,
+                 prepare=None):
+        self.sql_query = sql_query.strip().rstrip(";")
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.timeout_ms = timeout_ms
+        self.prepare = prepare
+        self.columns = []
+        self.row_count = 0
+        self.truncated = False
+        self.cancelled = False
+        self._stack = None
+        self._cursor = None
+        self._pending = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        self._stack = ExitStack()
+        try:
+            conn = self._stack.enter_context(connection(readonly=True, timeout_ms=self.timeout_ms))
+            with self._lock:
+                self._check_cancelled()
+                self._conn = conn
+            if self.prepare is not None:
+                self.sql_query = self.prepare(conn, self.sql_query)
+                # A cancel that landed between statements found the connection idle
+                with self._lock:
+                    self._check_cancelled()
+            self._cursor = conn.cursor(name=f"q_{uuid.uuid4().hex}")
+            self._cursor.itersize = self.batch_size
+            self._cursor.execute(self.sql_query)
+            # The first batch is needed anyway for cursor.description
+            self._pending = self._cursor.fetchmany(self._limit())
+            self.columns = [desc[0] for desc in self._cursor.description]
+        except BaseException:
+            with self._lock:
+                self._conn = None
+            self._stack.__exit__(*sys.exc_info())
+            self._stack = None
+            raise
+        return self
+
+    def fetch(self):
+        """Next batch of rows; an empty list once the result or the row cap is exhausted"""
+        # The server ignores a cancel while no statement runs, e.g. between two fetches
+        with self._lock:
+            self._check_cancelled()
+        if self._pending is not None:
+            rows, self._pending = self._pending, None
+        else:
+            limit = self._limit()
+            rows = self._cursor.fetchmany(limit) if limit > 0 else []
+        self.row_count += len(rows)
+        if not rows and self.max_rows is not None and self.row_count >= self.max_rows:
+            self.truncated = bool(self._cursor.fetchmany(1))
+        return rows
+
+    def cancel(self):
+        """Abort the statement in progress, or the query before it starts"""
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None and not self._conn.closed:
+                self._conn.cancel()
+
+    def close(self, exc_info=(None, None, None)):
+        with self._lock:
+            # The connection goes back to the pool; cancel() must not reach it after this
+            self._conn = None
+        if self._stack is not None:
+            stack, self._stack = self._stack, None
+            try:
+                if self._cursor is not None and not self._cursor.closed:
+                    self._cursor.close()
+            except psycopg2.Error:
+                pass
+            stack.__exit__(*exc_info)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close(exc_info)
+
+    def _check_cancelled(self):
+        if self.cancelled:
+            raise extensions.QueryCanceledError("canceling statement due to user request")
+
+    def _limit(self):
+        if self.max_rows is None:
+            return self.batch_size
+        return min(self.batch_size, self.max_rows - self.row_count)
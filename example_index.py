@@ -0,0 +1,133 @@
+import re
+import math
+import threading
+from collections import Counter
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+")
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "and", "or", "with", "is", "are",
+    "me", "show", "list", "find", "give", "get", "what", "which", "all", "please",
+}
+
+
+def _stem(token):
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed and plurals folded"""
+    return [_stem(t) for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class ExampleIndex:
+    """Incremental BM25 inverted index over training questions.
+
+    Documents are identified by their insertion order, which matches their
+    position in the example store. Postings are kept as Python lists while
+    they grow and materialized as NumPy arrays of term weights on first use
+    after a change; all weights are recomputed once the average document
+    length drifts by more than 10%.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = 0
+        self._postings = {}
+        self._arrays = {}
+        self._lengths = np.zeros(1024, dtype=np.float32)
+        self._total_length = 0
+        # Average document length the cached term weights were computed with
+        self._weights_avg = 0.0
+        self._scratch = np.zeros(1024, dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def add(self, texts):
+        """Append documents; returns the number added"""
+        with self._lock:
+            self._add(texts)
+        return len(texts)
+
+    def sync(self, texts):
+        """Index the documents of texts not indexed yet; returns the new size.
+
+        texts is the full, append-only list of documents. A shorter list is an
+        older snapshot of it and leaves the index as it is.
+        """
+        with self._lock:
+            if self.size < len(texts):
+                self._add(texts[self.size:])
+            return self.size
+
+    def search(self, text, k=3):
+        """Return ids of the k most similar documents, best first"""
+        query = Counter(tokenize(text))
+        with self._lock:
+            if not query or not self.size:
+                return []
+            n = self.size
+            avg_length = self._total_length / n
+            if abs(avg_length - self._weights_avg) > 0.1 * self._weights_avg:
+                self._arrays.clear()
+                self._weights_avg = avg_length
+
+            matched = False
+            for token in query:
+                arrays = self._array(token)
+                if arrays is None:
+                    continue
+                ids, weights = arrays
+                df = len(ids)
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                # Postings of one token never repeat a doc id, so += is safe here
+                self._scratch[ids] += np.float32(idf) * weights
+                matched = True
+            if not matched:
+                return []
+
+            scores = self._scratch[:n]
+            top = np.argpartition(scores, n - k)[n - k:] if n > k else np.arange(n)
+            top = top[np.argsort(-scores[top], kind="stable")]
+            top = top[scores[top] > 0]
+            scores[:] = 0.0
+        return top.tolist()
+
+    def _add(self, texts):
+        for text in texts:
+            counts = Counter(tokenize(text))
+            doc_id = self.size
+            if doc_id >= len(self._lengths):
+                self._grow()
+            for token, tf in counts.items():
+                ids, tfs = self._postings.setdefault(token, ([], []))
+                ids.append(doc_id)
+                tfs.append(tf)
+                self._arrays.pop(token, None)
+            length = sum(counts.values())
+            self._lengths[doc_id] = length
+            self._total_length += length
+            self.size += 1
+
+    def _array(self, token):
+        """Posting ids and BM25 term weights for token, without the idf factor"""
+        arrays = self._arrays.get(token)
+        if arrays is None:
+            postings = self._postings.get(token)
+            if postings is None:
+                return None
+            ids = np.asarray(postings[0], dtype=np.intp)
+            tfs = np.asarray(postings[1], dtype=np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * self._lengths[ids] / max(self._weights_avg, 1.0))
+            arrays = self._arrays[token] = (ids, tfs * (self.k1 + 1.0) / (tfs + norm))
+        return arrays
+
+    def _grow(self):
+        capacity = len(self._lengths) * 2
+        self._lengths = np.resize(self._lengths, capacity)
+        self._lengths[self.size:] = 0
+        self._scratch = np.zeros(capacity, dtype=np.float32)
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+def question_hash(nl):
+    return hashlib.md5(nl.encode()).hexdigest()
+
+
+class ExampleStore:
+    """Append-only SQLite store of training examples with an in-memory mirror.
+
+    Rows are never rewritten, so the mirror is refreshed by reading only rows
+    past the highest id it has seen. Changes made by other processes are
+    noticed through PRAGMA data_version, which is a local, I/O-free check.
+    """
+
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS examples (
+                id INTEGER PRIMARY KEY,
+                nl_hash TEXT NOT NULL UNIQUE,
+                natural_language TEXT NOT NULL,
+                sql TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+        self._examples = {"natural_language": [], "sql": []}
+        self._hashes = set()
+        self._last_id = 0
+        self._data_version = None
+        self._loaded = False
+
+        if legacy_path and os.path.exists(legacy_path) and self.count() == 0:
+            self._import_legacy(legacy_path)
+
+    def load(self):
+        """All examples as {"natural_language": [...], "sql": [...]}; treat as read-only"""
+        with self._lock:
+            self._sync()
+            return self._examples
+
+    def add(self, new_nl, new_sql):
+        """Insert unseen questions; returns how many were added"""
+        with self._lock:
+            self._sync()
+            rows = []
+            for nl, sql in zip(new_nl, new_sql):
+                nl_hash = question_hash(nl)
+                if nl_hash not in self._hashes:
+                    self._hashes.add(nl_hash)
+                    rows.append((nl_hash, nl, sql))
+            if not rows:
+                return 0
+
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO examples (nl_hash, natural_language, sql) VALUES (?, ?, ?)",
+                rows,
+            )
+            added = self._conn.total_changes - before
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_updated', ?)", (time.time(),)
+            )
+            self._conn.commit()
+            self._fetch_new()
+            return added
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM examples").fetchone()[0]
+
+    def last_updated(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'last_updated'").fetchone()
+        return row[0] if row else None
+
+    def _sync(self):
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if not self._loaded or data_version != self._data_version:
+            self._fetch_new()
+            self._data_version = data_version
+            self._loaded = True
+
+    def _fetch_new(self):
+        cursor = self._conn.execute(
+            "SELECT id, nl_hash, natural_language, sql FROM examples WHERE id > ? ORDER BY id",
+            (self._last_id,),
+        )
+        for row_id, nl_hash, nl, sql in cursor:
+            self._examples["natural_language"].append(nl)
+            self._examples["sql"].append(sql)
+            self._hashes.add(nl_hash)
+            self._last_id = row_id
+
+    def _import_legacy(self, legacy_path):
+        try:
+            with open(legacy_path, 'r') as f:
+                legacy = json.load(f)
+            added = self.add(legacy.get("natural_language", []), legacy.get("sql", []))
+            print(f"Imported {added} examples from {legacy_path}")
+        except Exception as e:
+            print(f"Error importing examples: {e}")
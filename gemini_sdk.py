@@ -1,13 +1,15 @@
 import os
-import json
-import hashlib
-from datetime import datetime
 import google.generativeai as genai
 from dotenv import load_dotenv
-import psycopg2
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from schema_catalog import catalog
+from concurrency import run_blocking
+from sql_cache import sql_cache
+from example_index import ExampleIndex
+from example_store import ExampleStore
+from summarize import estimate_tokens
+from llm_client import LLMClient
+import metrics
+from metrics import span, LLM_PROMPT_TOKENS, LLM_RESPONSE_TOKENS
 
 load_dotenv()
 
@@ -20,168 +22,80 @@ os.makedirs(EXAMPLES_DIR, exist_ok=True)
 
 model = genai.GenerativeModel(MODEL_NAME)
 
-SMTP_SERVER = os.getenv("SMTP_SERVER")    
-SMTP_PORT = os.getenv("SMTP_PORT")
-EMAIL_USER = os.getenv("EMAIL_USER")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")  
-EMAIL_TO = os.getenv("EMAIL_TO")
+# Optional second model used while the primary is failing
+FALLBACK_MODEL_NAME = os.getenv("GEMINI_FALLBACK_MODEL")
+llm = LLMClient(
+    model, MODEL_NAME,
+    fallback=genai.GenerativeModel(FALLBACK_MODEL_NAME) if FALLBACK_MODEL_NAME else None,
+    fallback_name=FALLBACK_MODEL_NAME,
+)
+metrics.register_collector(lambda: [
+    ("llm_circuits_open", "gauge", "Models currently skipped by the circuit breaker",
+     sum(state == "open" for state in llm.breaker_states().values())),
+])
+
+# Number of training examples placed in each generation prompt
+PROMPT_EXAMPLES = int(os.getenv("PROMPT_EXAMPLES", "3"))
+
+example_store = ExampleStore(
+    os.path.join(EXAMPLES_DIR, 'examples.db'),
+    legacy_path=os.path.join(EXAMPLES_DIR, 'examples.json'),
+)
+example_index = ExampleIndex()
 
 
 def fetch_table_structure():
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("DB_HOST"),
-            database=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            port=os.getenv("DB_PORT"),
-        )
-        cur = conn.cursor()
-
-        table_structure = "You must assume the following PostgreSQL database schema:\n\nTables:\n"
-
-        cur.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema='public' AND table_type='BASE TABLE'
-        """)
-        tables = cur.fetchall()
-
-        for table in tables:
-            table_name = table[0]
-            table_structure += f"\n{table_name}\n"
-
-# cur.execute(f"""
-#     SELECT column_name, data_type 
-#     FROM information_schema.columns 
-#     WHERE table_name = '{table_name}'
-# """)
-
-            cur.execute("""
-            SELECT column_name, data_type
-            FROM information_schema.columns 
-            WHERE table_name = %s
-            """, (table_name,))
-            columns = cur.fetchall()
-
-            for column in columns:
-                table_structure += f"- {column[0]} ({column[1]})\n"
-
-        
-        # Example: Calculate total revenue
-        cur.execute("""
-        SELECT SUM(quantity_sold * unit_price) AS total_revenue
-        FROM sales_table;
-        """)
-        result = cur.fetchone()
-        total_revenue = result[0] if result[0] is not None else 0
-
-        print(f"Total Revenue: {total_revenue}")
-        
-        # Check if revenue is less than 20,000
-        if total_revenue < 20000:
-        # Prepare HTML email
-           subject = "⚠️ Revenue Alert: Low Revenue Detected!"
-           html_content = f"""
-           <html>
-           <body>
-            <h2 style="color: red;">Revenue Alert 🚨</h2>
-            <p>Dear Team,</p>
-            <p>The total revenue has dropped below the threshold.</p>
-            <p><strong>Current Revenue:</strong> ${total_revenue:,.2f}</p>
-            <p>Please take immediate action.</p>
-            <hr>
-            <p style="font-size:12px;color:gray;">This is an automated message from the Financial Monitoring System.</p>
-           </body>
-           </html>
-           """
-
-           # Set up email message
-           message = MIMEMultipart('alternative')
-           message['From'] = EMAIL_USER
-           message['To'] = EMAIL_TO
-           message['Subject'] = subject
-
-           message.attach(MIMEText(html_content, 'html'))
-
-           # Send the email
-           with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-              server.starttls()  # Secure the connection
-              server.login(EMAIL_USER, EMAIL_PASSWORD)
-              server.sendmail(EMAIL_USER, EMAIL_TO, message.as_string())
-
-           print("✅ Alert Email sent successfully.")
-
-        else:
-           print("✅ Revenue is healthy, no email sent.")
-
-
-        cur.close()
-        conn.close()
-
-
-        return table_structure
-
+        with span("schema"):
+            return catalog.get_text()
     except Exception as e:
         print(f"Error fetching table structure: {e}")
         return ""
+
 def load_training_examples():
     """Load saved examples with error handling"""
-    examples_file = os.path.join(EXAMPLES_DIR, 'examples.json')
     try:
-        if os.path.exists(examples_file):
-            with open(examples_file, 'r') as f:
-                return json.load(f)
+        return example_store.load()
     except Exception as e:
         print(f"Error loading examples: {e}")
     return {"natural_language": [], "sql": []}
 
-def save_training_examples(examples):
-    """Save examples with atomic write"""
-    temp_file = os.path.join(EXAMPLES_DIR, 'temp_examples.json')
-    examples_file = os.path.join(EXAMPLES_DIR, 'examples.json')
-    
-    try:
-        with open(temp_file, 'w') as f:
-            json.dump(examples, f, indent=2)
-        os.replace(temp_file, examples_file)  # Atomic operation
-    except Exception as e:
-        print(f"Error saving examples: {e}")
-
 def add_training_examples(new_nl, new_sql):
     """Add new examples with content-based deduplication"""
-    examples = load_training_examples()
-    existing_hashes = {hashlib.md5(nl.encode()).hexdigest(): i 
-                      for i, nl in enumerate(examples["natural_language"])}
-    
-    added = 0
-    for nl, sql in zip(new_nl, new_sql):
-        nl_hash = hashlib.md5(nl.encode()).hexdigest()
-        if nl_hash not in existing_hashes:
-            examples["natural_language"].append(nl)
-            examples["sql"].append(sql)
-            existing_hashes[nl_hash] = len(examples["natural_language"]) - 1
-            added += 1
-    
+    added = example_store.add(new_nl, new_sql)
     if added > 0:
-        save_training_examples(examples)
+        sync_example_index(example_store.load())
     return added
 
-def get_chat_completion(messages, chart_mode=False):
-    try:
-        user_message = messages[-1]["content"]
-        examples = load_training_examples()
-        
-        prompt = f"""Database Expert Instructions:
-{fetch_table_structure()}
-
-Recent Examples:
+def sync_example_index(examples):
+    """Index any examples appended since the last sync"""
+    example_index.sync(examples["natural_language"])
+
+def warm_example_index():
+    """Index the stored examples ahead of the first request"""
+    sync_example_index(load_training_examples())
+
+def select_examples(user_message, examples, k=PROMPT_EXAMPLES):
+    """Most similar (question, sql) pairs, falling back to the most recent ones"""
+    sync_example_index(examples)
+    count = len(examples["natural_language"])
+    # An ingest may have indexed examples newer than this snapshot of the store
+    ids = [i for i in example_index.search(user_message, k) if i < count]
+    if not ids:
+        ids = range(max(count - k, 0), count)
+    return [(examples["natural_language"][i], examples["sql"][i]) for i in ids]
+
+def build_prompt(user_message, table_structure, examples, chart_mode=False):
+    prompt = f"""Database Expert Instructions:
+{table_structure}
+
+Relevant Examples:
 """
-        # Add most relevant examples
-        for nl, sql in zip(examples["natural_language"][-3:], examples["sql"][-3:]):
-            prompt += f"\nQ: {nl}\nA: {sql}\n"
-        
-        prompt += f"""
+    # Add most relevant examples
+    for nl, sql in examples:
+        prompt += f"\nQ: {nl}\nA: {sql}\n"
+
+    prompt += f"""
 Rules:
 - Generate precise PostgreSQL queries
 - Use only the schema shown
@@ -192,11 +106,61 @@ Rules:
 New Query:
 Q: {user_message}
 A: """
-        
-        response = model.generate_content(prompt)
-        sql = response.text.strip().removeprefix('```sql').removesuffix('```').strip()
-        return sql
+    return prompt
+
+async def generate_sql(user_message, table_structure, chart_mode=False, examples=None):
+    with span("prompt"):
+        if examples is None:
+            examples = await run_blocking("io", load_training_examples)
+        # Indexing new examples and BM25 scoring are CPU-bound and may wait on an ingest
+        selected = await run_blocking("io", select_examples, user_message, examples)
+        prompt = build_prompt(user_message, table_structure, selected, chart_mode)
+
+    with span("llm_sql"):
+        text = await llm.generate(prompt, call="sql")
+    LLM_PROMPT_TOKENS.observe(estimate_tokens(prompt), "sql")
+    LLM_RESPONSE_TOKENS.observe(estimate_tokens(text), "sql")
+    return text.strip().removeprefix('```sql').removesuffix('```').strip()
+
+async def prepare_batch():
+    """Load the schema and examples once for a batch; returns the examples to pass on"""
+    if not catalog.is_fresh():
+        await run_blocking("db", fetch_table_structure)
+    examples = await run_blocking("io", load_training_examples)
+    await run_blocking("io", sync_example_index, examples)
+    return examples
+
+def _cache_key(user_message, chart_mode, examples):
+    # The example store only grows, so its size versions the examples the SQL was written with
+    return sql_cache.make_key(user_message, chart_mode, catalog.version, len(examples["natural_language"]))
+
+async def get_chat_completion(messages, chart_mode=False, examples=None):
+    try:
+        user_message = messages[-1]["content"]
+        if not catalog.is_fresh():
+            await run_blocking("db", fetch_table_structure)
+        if examples is None:
+            examples = await run_blocking("io", load_training_examples)
+
+        # Repeated questions against the same schema and examples skip the LLM
+        # entirely; otherwise only the tables relevant to the question go into the prompt
+        key = _cache_key(user_message, chart_mode, examples)
+
+        async def generate():
+            with span("prompt"):
+                table_structure = catalog.select_text(user_message)
+            return await generate_sql(user_message, table_structure, chart_mode, examples)
+
+        return await sql_cache.get_or_generate(key, generate)
     except Exception as e:
         print(f"Generation error: {e}")
         raise
 
+async def forget_sql(messages, sql_query, chart_mode=False, examples=None):
+    """Drop cached SQL that was refused or failed to run, so the next ask regenerates it"""
+    try:
+        if examples is None:
+            examples = await run_blocking("io", load_training_examples)
+        await sql_cache.discard(_cache_key(messages[-1]["content"], chart_mode, examples), sql_query)
+    except Exception as e:
+        print(f"Error dropping cached SQL: {e}")
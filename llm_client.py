@@ -0,0 +1,286 @@
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
+from concurrency import limiter
+from metrics import LLM_ATTEMPTS, LLM_HEDGES
+
+load_dotenv()
+
+# Upper bound on one generate() call, retries and fallback included
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+# Upper bound on a single request to the model
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "25"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Base of the exponential backoff; each wait is drawn uniformly below it (full jitter)
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+# Send a second, hedged request when the first is slower than the observed p95
+LLM_HEDGE = os.getenv("LLM_HEDGE", "true").lower() == "true"
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+# Successful calls needed before the p95 is trusted for hedging
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+# Consecutive failures that open the circuit, and seconds before it is retried
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# Upstream errors worth another attempt; anything else (bad request, blocked
+# prompt, auth) fails the call straight away
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServerError,
+)
+
+
+def _outcome(error):
+    if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    return type(error).__name__
+
+
+class LLMUnavailable(Exception):
+    """No model could answer within the deadline, or every circuit is open"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one trial call through after the cooldown"""
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_at = None
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open" and now - self._opened_at >= self.cooldown:
+            self.state = "half_open"
+            self._trial_at = None
+        # A trial that never reported back (cancelled, say) is replaced after a cooldown
+        if self.state == "half_open" and (self._trial_at is None or now - self._trial_at >= self.cooldown):
+            self._trial_at = now
+            return True
+        return False
+
+    def retry_in(self):
+        return max(self.cooldown - (time.monotonic() - self._opened_at), 0.0)
+
+    def record_success(self):
+        self.state = "closed"
+        self._consecutive = 0
+
+    def record_failure(self):
+        self._consecutive += 1
+        if self.state == "half_open" or self._consecutive >= self.failures:
+            if self.state != "open":
+                print(f"LLM circuit opened after {self._consecutive} failures")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+
+class LatencyWindow:
+    """Latencies of recent successful calls"""
+
+    def __init__(self, size=LLM_LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def p95(self):
+        if len(self._samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+
+class _Target:
+    def __init__(self, name, model):
+        self.name = name
+        self.model = model
+        self.breaker = CircuitBreaker()
+        self.latency = {}
+
+    def window(self, call):
+        window = self.latency.get(call)
+        if window is None:
+            window = self.latency[call] = LatencyWindow()
+        return window
+
+
+class LLMClient:
+    """Gemini calls with deadlines, jittered retries, hedging, a circuit breaker and a fallback model.
+
+    The fallback model, if any, is used once the primary has run out of
+    retries or while its circuit is open. Latency percentiles are tracked per
+    model and call kind, since SQL generation and answers differ in length.
+    """
+
+    def __init__(self, model, model_name, fallback=None, fallback_name=None, deadline=LLM_DEADLINE,
+                 attempt_timeout=LLM_ATTEMPT_TIMEOUT, max_retries=LLM_MAX_RETRIES, hedge=LLM_HEDGE):
+        self.targets = [_Target(model_name, model)]
+        if fallback is not None:
+            self.targets.append(_Target(fallback_name, fallback))
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.hedge = hedge
+
+    async def generate(self, prompt, call="sql"):
+        """Text of the model's reply to prompt"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        last_error = None
+        for target in self.targets:
+            for attempt in range(self.max_retries + 1):
+                remaining = self._remaining(deadline, last_error)
+                if not target.breaker.allow():
+                    break
+                try:
+                    text = await asyncio.wait_for(self._hedged(target, prompt, call, deadline), remaining)
+                except RETRYABLE_ERRORS as e:
+                    target.breaker.record_failure()
+                    last_error = e
+                    print(f"LLM call to {target.name} failed ({type(e).__name__}), attempt {attempt + 1}")
+                    if attempt < self.max_retries:
+                        await self._backoff(attempt, deadline)
+                    continue
+                except Exception:
+                    # The service answered, just not usefully; that says nothing about its health
+                    target.breaker.record_success()
+                    raise
+                target.breaker.record_success()
+                return text
+        raise self._unavailable(last_error)
+
+    async def stream(self, prompt, call="answer"):
+        """Yield the reply as it is generated.
+
+        Failures before the first piece are retried like generate(); once text
+        has been yielded, an error is raised rather than restarting the answer.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        last_error = None
+        for target in self.targets:
+            for attempt in range(self.max_retries + 1):
+                # Checked before the breaker so an expired request neither uses up a trial call
+                # nor charges failures to a model it never reached
+                self._remaining(deadline, last_error)
+                if not target.breaker.allow():
+                    break
+                started = False
+                try:
+                    async for text in self._stream_attempt(target, prompt, call, deadline):
+                        started = True
+                        yield text
+                except RETRYABLE_ERRORS as e:
+                    target.breaker.record_failure()
+                    if started:
+                        raise
+                    last_error = e
+                    print(f"LLM stream from {target.name} failed ({type(e).__name__}), attempt {attempt + 1}")
+                    if attempt < self.max_retries:
+                        await self._backoff(attempt, deadline)
+                    continue
+                except Exception:
+                    target.breaker.record_success()
+                    raise
+                target.breaker.record_success()
+                return
+        raise self._unavailable(last_error)
+
+    async def _hedged(self, target, prompt, call, deadline):
+        """One logical attempt; a duplicate request races the first once it passes the p95"""
+        first = asyncio.ensure_future(self._attempt(target, prompt, call, deadline))
+        tasks = {first}
+        try:
+            delay = target.window(call).p95() if self.hedge else None
+            if delay is None:
+                return await first
+            done, _ = await asyncio.wait(tasks, timeout=max(delay, LLM_HEDGE_MIN_DELAY))
+            # No hedge when the limiter is saturated; it would only add load
+            if not done and not limiter("llm").locked():
+                LLM_HEDGES.inc(1, target.name)
+                tasks.add(asyncio.ensure_future(self._attempt(target, prompt, call, deadline)))
+
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            raise next(iter(done)).exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _attempt(self, target, prompt, call, deadline):
+        async with limiter("llm"):
+            timeout = min(self.attempt_timeout, deadline - asyncio.get_running_loop().time())
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(target.model.generate_content_async(prompt), timeout)
+                text = response.text
+            except BaseException as e:
+                LLM_ATTEMPTS.inc(1, target.name, _outcome(e))
+                raise
+        target.window(call).add(time.perf_counter() - start)
+        LLM_ATTEMPTS.inc(1, target.name, "ok")
+        return text
+
+    async def _stream_attempt(self, target, prompt, call, deadline):
+        loop = asyncio.get_running_loop()
+        async with limiter("llm"):
+            start = time.perf_counter()
+            try:
+                timeout = min(self.attempt_timeout, deadline - loop.time())
+                response = await asyncio.wait_for(
+                    target.model.generate_content_async(prompt, stream=True), timeout)
+                chunks = response.__aiter__()
+                while True:
+                    # Each piece must arrive within the attempt timeout and the overall deadline
+                    timeout = min(self.attempt_timeout, deadline - loop.time())
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), max(timeout, 0))
+                    except StopAsyncIteration:
+                        break
+                    if chunk.text:
+                        yield chunk.text
+            except BaseException as e:
+                LLM_ATTEMPTS.inc(1, target.name, _outcome(e))
+                raise
+        target.window(call).add(time.perf_counter() - start)
+        LLM_ATTEMPTS.inc(1, target.name, "ok")
+
+    async def _backoff(self, attempt, deadline):
+        delay = random.uniform(0, LLM_RETRY_BASE_DELAY * 2 ** attempt)
+        remaining = deadline - asyncio.get_running_loop().time()
+        await asyncio.sleep(max(min(delay, remaining), 0))
+
+    def _remaining(self, deadline, last_error):
+        """Seconds left before deadline; raises LLMUnavailable once it has passed"""
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            raise LLMUnavailable(f"No reply from the model within {self.deadline:g}s") from last_error
+        return remaining
+
+    def _unavailable(self, last_error):
+        if last_error is None:
+            retry_in = min(target.breaker.retry_in() for target in self.targets)
+            return LLMUnavailable(f"The model is unavailable; retrying in {retry_in:.0f}s")
+        return LLMUnavailable(f"The model did not answer: {type(last_error).__name__}: {last_error}")
+
+    def breaker_states(self):
+        return {target.name: target.breaker.state for target in self.targets}
@@ -1,16 +1,31 @@
-from fastapi import FastAPI, Request, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, Request, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-import psycopg2
 import os
 import json
+import asyncio
 import hashlib
+import tempfile
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date, time as dt_time
+from decimal import Decimal
 from dotenv import load_dotenv
-from gemini_sdk import get_chat_completion, model, add_training_examples, load_training_examples
+import db
+from gemini_sdk import (get_chat_completion, forget_sql, prepare_batch, llm, add_training_examples, example_store,
+                        warm_example_index)
+from schema_catalog import catalog
+import concurrency
+from concurrency import run_blocking
+from sql_cache import sql_cache, normalize_question
+from chart_data import ChartSeries
+from summarize import ResultSummary, summarize_result, estimate_tokens
+from sql_guard import queries, QueryCancelled
+from dataset_ingest import UploadIndex, IngestJobs, ingest_dataset, UPLOAD_CHUNK_SIZE
+from revenue_monitor import monitor, REVENUE_MONITOR_ENABLED
+import metrics
+from metrics import span, LLM_PROMPT_TOKENS, LLM_RESPONSE_TOKENS, QUERY_ROWS
 
 load_dotenv()
 app = FastAPI()
@@ -18,8 +33,26 @@ app = FastAPI()
 # Setup directories
 os.makedirs("uploads", exist_ok=True)
 os.makedirs("training_examples", exist_ok=True)
+# Uploads in progress; kept out of the served and listed uploads directory
+UPLOAD_STAGING_DIR = "upload_staging"
+os.makedirs(UPLOAD_STAGING_DIR, exist_ok=True)
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
+upload_index = UploadIndex(os.path.join("training_examples", "uploads.db"))
+ingest_jobs = IngestJobs()
+
+
+# Row cap for results returned in a single /chat response
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "10000"))
+# Row cap for results streamed by /chat/stream
+SQL_STREAM_MAX_ROWS = int(os.getenv("SQL_STREAM_MAX_ROWS", "1000000"))
+
+# Row cap for chart queries; rows are held as NumPy columns, not Python tuples
+CHART_MAX_ROWS = int(os.getenv("CHART_MAX_ROWS", "2000000"))
+
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+# Questions of one batch in flight at once; the per-stage limits still apply
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
 
 # Allow CORS
 app.add_middleware(
@@ -30,57 +63,77 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# PostgreSQL connection
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("DB_HOST"),
-        database=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        port=os.getenv("DB_PORT"),
-    )
-
-def run_sql_query(sql_query):
+def run_sql_query(sql_query, max_rows=SQL_MAX_ROWS, query_id=None):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(sql_query)
-        rows = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
-        cur.close()
-        conn.close()
-        return {"columns": columns, "rows": rows}
+        rows = []
+        with span("db"), queries.cursor(query_id, sql_query, max_rows=max_rows) as cursor:
+            while batch := cursor.fetch():
+                rows.extend(batch)
+        QUERY_ROWS.observe(len(rows), "table")
+        return {"columns": cursor.columns, "rows": rows, "truncated": cursor.truncated}
     except Exception as e:
         print(f"Database error: {e}")
         raise e
 
-def convert_to_human_readable(user_prompt, db_result):
-    try:
-        if not db_result["rows"]:
-            return "No results found."
-
-        rows_text = ""
-        for row in db_result["rows"]:
-            rows_text += ", ".join(str(item) for item in row) + "\n"
-
-        second_prompt = f"""
+def fetch_chart_data(sql_query, max_rows=CHART_MAX_ROWS, query_id=None):
+    """Run a chart query into columnar arrays and downsample it for the browser"""
+    series = ChartSeries()
+    with span("db"), queries.cursor(query_id, sql_query, max_rows=max_rows) as cursor:
+        while batch := cursor.fetch():
+            series.add(batch)
+    QUERY_ROWS.observe(cursor.row_count, "chart")
+    with span("chart"):
+        chart_data = series.to_chart(cursor.columns)
+    chart_data["truncated"] = cursor.truncated
+    return chart_data
+
+def build_answer_prompt(user_prompt, summary):
+    return f"""
 User asked: "{user_prompt}"
 
-Here is the SQL query result:
-{rows_text}
+Here is a summary of the SQL query result:
+{summary.render()}
 
 Based on the user's request and the SQL result, generate a human-readable answer.
 Do not show raw data.
 """
 
-        response = model.generate_content(second_prompt)
-        return response.text.strip()
+async def convert_to_human_readable(user_prompt, db_result):
+    try:
+        if not db_result["rows"]:
+            return "No results found."
+
+        with span("summarize"):
+            second_prompt = build_answer_prompt(user_prompt, summarize_result(db_result))
+
+        with span("llm_answer"):
+            answer = await llm.generate(second_prompt, call="answer")
+        LLM_PROMPT_TOKENS.observe(estimate_tokens(second_prompt), "answer")
+        LLM_RESPONSE_TOKENS.observe(estimate_tokens(answer), "answer")
+        return answer.strip()
 
     except Exception as e:
         print(f"Error in human-readable conversion: {e}")
         return "Couldn't generate human readable answer."
 
-
+async def stream_human_readable(user_prompt, summary):
+    """Yield the human-readable answer piece by piece as the model produces it"""
+    if not summary.row_count:
+        yield "No results found."
+        return
+    try:
+        with span("summarize"):
+            second_prompt = build_answer_prompt(user_prompt, summary)
+        LLM_PROMPT_TOKENS.observe(estimate_tokens(second_prompt), "answer")
+        answer_length = 0
+        with span("llm_answer"):
+            async for text in llm.stream(second_prompt, call="answer"):
+                answer_length += len(text)
+                yield text
+        LLM_RESPONSE_TOKENS.observe(answer_length // 4 + 1, "answer")
+    except Exception as e:
+        print(f"Error in human-readable conversion: {e}")
+        yield "Couldn't generate human readable answer."
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -105,64 +158,161 @@ def cleanup_old_uploads(days=1):
         filepath = os.path.join("uploads", filename)
         if os.path.isfile(filepath) and os.path.getmtime(filepath) < cutoff:
             os.remove(filepath)
+            upload_index.forget(filename)
+    # Staged files left behind by an interrupted upload
+    for filename in os.listdir(UPLOAD_STAGING_DIR):
+        filepath = os.path.join(UPLOAD_STAGING_DIR, filename)
+        if os.path.isfile(filepath) and os.path.getmtime(filepath) < cutoff:
+            os.remove(filepath)
 
 @app.on_event("startup")
 async def startup():
     cleanup_old_uploads()
+    try:
+        db.init_pool()
+    except Exception as e:
+        # The pool is created lazily on first use if the database is not up yet
+        print(f"Database pool not initialized: {e}")
+    await run_blocking("io", warm_example_index)
+    if REVENUE_MONITOR_ENABLED:
+        monitor.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    monitor.stop()
+    db.close_pool()
+    concurrency.shutdown()
 
 @app.post("/upload-dataset")
-async def upload_dataset(file: UploadFile = File(...)):
+async def upload_dataset(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     try:
-        content = await file.read()
-        
-        # Normalize JSON to prevent formatting differences
+        # Stage the upload on disk chunk by chunk, hashing the raw bytes on the way
+        raw_digest = hashlib.sha256()
+        staged = tempfile.NamedTemporaryFile(
+            dir=UPLOAD_STAGING_DIR, prefix="incoming_", suffix=".part", delete=False)
         try:
-            data = json.loads(content)
-            normalized = json.dumps(data, sort_keys=True, indent=2).encode()
-            content_hash = hashlib.md5(normalized).hexdigest()
-        except json.JSONDecodeError as e:
-            raise HTTPException(400, "Invalid JSON format") from e
-
-        # Check for existing identical content
-        for existing in os.listdir("uploads"):
-            with open(os.path.join("uploads", existing), "rb") as f:
-                if hashlib.md5(f.read()).hexdigest() == content_hash:
-                    return JSONResponse(
-                        {"status": "exists", "file": existing},
-                        status_code=200
-                    )
-
-        # Save new file
-        filename = f"dataset_{content_hash[:8]}.json"
-        filepath = os.path.join("uploads", filename)
-        with open(filepath, "wb") as f:
-            f.write(normalized)
-
-        # Add to training examples
-        added = add_training_examples(data["natural_language"], data["sql"])
-        
-        return JSONResponse({
-            "status": "success",
-            "added": added,
-            "total_examples": len(load_training_examples()["natural_language"]),
-            "file": filename
-        })
-    
+            try:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await run_blocking("io", _stage_chunk, staged, raw_digest, chunk)
+            finally:
+                staged.close()
+            raw_hash = raw_digest.hexdigest()
+
+            # Byte-identical re-uploads are rejected without parsing
+            existing = await run_blocking("io", upload_index.find_raw, raw_hash)
+        except BaseException:
+            # Failed or abandoned uploads leave nothing behind; the ingest job owns the file after this
+            os.remove(staged.name)
+            raise
+        if existing:
+            os.remove(staged.name)
+            return JSONResponse(
+                {"status": "exists", "file": existing},
+                status_code=200
+            )
+
+        job_id = ingest_jobs.create()
+        background_tasks.add_task(
+            ingest_dataset, ingest_jobs, job_id, staged.name, raw_hash,
+            upload_index, add_training_examples, "uploads"
+        )
+        return JSONResponse({"status": "accepted", "job_id": job_id}, status_code=202)
+
     except Exception as e:
         raise HTTPException(500, f"Processing error: {str(e)}") from e
 
+def _stage_chunk(staged, digest, chunk):
+    digest.update(chunk)
+    staged.write(chunk)
+
+@app.get("/upload-dataset/{job_id}")
+async def upload_status(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Unknown job")
+    if job["status"] == "success":
+        job["total_examples"] = await run_blocking("io", example_store.count)
+    return job
+
 @app.get("/training-status")
 async def training_status():
-    examples = load_training_examples()
     return {
-        "example_count": len(examples["natural_language"]),
-        "last_updated": os.path.getmtime(os.path.join("training_examples", "examples.json")) 
-                       if os.path.exists(os.path.join("training_examples", "examples.json")) 
-                       else None
+        "example_count": await run_blocking("io", example_store.count),
+        "last_updated": await run_blocking("io", example_store.last_updated)
     }
 
+@app.post("/schema/refresh")
+async def refresh_schema():
+    try:
+        await run_blocking("db", catalog.refresh)
+    except Exception as e:
+        raise HTTPException(500, f"Schema refresh failed: {str(e)}") from e
+    return {
+        "status": "refreshed",
+        "tables": len(catalog.tables),
+        "version": catalog.version
+    }
+
+@app.get("/schema/stats")
+async def schema_stats():
+    return {
+        "tables": len(catalog.tables),
+        "version": catalog.version,
+        "pruning": catalog.prune_stats()
+    }
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"sql": sql_cache.stats()}
+
 # ... (keep your existing chat endpoint and other routes) ...
 
+async def answer_question(messages, query_id=None, examples=None, include_timings=False, endpoint="chat"):
+    """Generate, run and explain the SQL for the last message; errors are returned, not raised"""
+    user_prompt = messages[-1]["content"]
+    started = time.perf_counter()
+    timings = metrics.start_request()
+    result = await _answer(user_prompt, messages, query_id, examples)
+    metrics.finish_request(endpoint, timings, started, error=result["error"])
+    if include_timings:
+        result["timings"] = _rounded(timings)
+    return result
+
+async def _answer(user_prompt, messages, query_id, examples):
+    chart_mode = "chart" in user_prompt.lower()
+    sql_query = None
+    try:
+        with queries.track(query_id) as query_id:
+            sql_query = await get_chat_completion(messages, chart_mode=chart_mode, examples=examples)
+            if chart_mode:
+                chart_data = await run_blocking("db", fetch_chart_data, sql_query, query_id=query_id)
+                return {
+                    "sql_query": sql_query,
+                    "chart_data": chart_data,
+                    "error": False
+                }
+            else:
+                db_result = await run_blocking("db", run_sql_query, sql_query, query_id=query_id)
+                human_answer = await convert_to_human_readable(user_prompt, db_result)
+
+                return {
+                    "sql_query": sql_query,
+                    "db_result": db_result,
+                    "human_answer": human_answer,
+                    "error": False
+                }
+
+    except Exception as e:
+        if sql_query is not None and not isinstance(e, QueryCancelled):
+            await forget_sql(messages, sql_query, chart_mode, examples)
+        return {
+            "sql_query": "",
+            "db_result": {"columns": [], "rows": []},
+            "chart_data": None,
+            "human_answer": f"Sorry, an error occurred: {str(e)}",
+            "error": True
+        }
+
 @app.post("/chat")
 async def chat(request: Request):
     data = await request.json()
@@ -171,52 +321,163 @@ async def chat(request: Request):
     if not messages:
         return {"reply": "No message provided."}
 
-    user_prompt = messages[-1]["content"]
+    return await answer_question(messages, data.get("query_id"), include_timings=bool(data.get("timings")))
+
+@app.post("/chat/batch")
+async def chat_batch(request: Request):
+    """Answer a list of questions concurrently; results come back in the order asked"""
+    data = await request.json()
+    questions = data.get("questions", [])
+    include_timings = bool(data.get("timings"))
+
+    if not isinstance(questions, list) or not all(isinstance(q, str) and q.strip() for q in questions):
+        raise HTTPException(400, "questions must be a list of non-empty strings")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(400, f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+
+    # Schema and examples are loaded once and shared by every question
+    try:
+        examples = await prepare_batch()
+    except Exception as e:
+        raise HTTPException(500, f"Could not prepare batch: {str(e)}") from e
+
+    # Questions differing only in case, spacing or punctuation are answered once
+    unique = {}
+    for question in questions:
+        unique.setdefault(normalize_question(question), question)
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def answer(question):
+        async with semaphore:
+            return await answer_question([{"role": "user", "content": question}], examples=examples,
+                                         include_timings=include_timings, endpoint="batch")
 
+    answers = await asyncio.gather(*(answer(q) for q in unique.values()))
+    by_question = dict(zip(unique, answers))
+    return {
+        "results": [{"question": q, **by_question[normalize_question(q)]} for q in questions],
+        "unique_questions": len(unique)
+    }
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    data = await request.json()
+    messages = data.get("messages", [])
+
+    if not messages:
+        return {"reply": "No message provided."}
+
+    return StreamingResponse(stream_chat(messages, data.get("query_id"), bool(data.get("timings"))),
+                             media_type="application/x-ndjson")
+
+async def stream_chat(messages, query_id=None, include_timings=False):
+    """NDJSON events: meta (SQL and columns), rows batches, then chart or answer pieces, then done"""
+    user_prompt = messages[-1]["content"]
+    chart_mode = "chart" in user_prompt.lower()
+    sql_query = None
+    cursor = None
+    started = time.perf_counter()
+    timings = metrics.start_request()
+    failed = True
     try:
-        chart_mode = "chart" in user_prompt.lower()
-
-        sql_query = get_chat_completion(messages, chart_mode=chart_mode)
-        db_result = run_sql_query(sql_query)
-        
-        if chart_mode:
-            chart_data = {"x": [], "y": []}
-            for row in db_result["rows"]:
-                chart_data["x"].append(row[0])
-                chart_data["y"].append(row[1])
-
-            x_label = db_result["columns"][0] if db_result["columns"] else "X Axis"
-            y_label = db_result["columns"][1] if len(db_result["columns"]) > 1 else "Y Axis"
-
-  
-            return {
-                "sql_query": sql_query,
-                "chart_data": {
-                    "x": chart_data["x"],
-                    "y": chart_data["y"],
-                    "x_label": x_label,
-                    "y_label": y_label
-                },
-                "error": False
-            }
-        else:
-            human_answer = convert_to_human_readable(user_prompt, db_result)
-
-            return {
-                "sql_query": sql_query,
-                "db_result": db_result,
-                "human_answer": human_answer,
-                "error": False
-            }
+        with queries.track(query_id) as query_id:
+            sql_query = await get_chat_completion(messages, chart_mode=chart_mode)
+
+            if chart_mode:
+                chart_data = await run_blocking("db", fetch_chart_data, sql_query, query_id=query_id)
+                yield _ndjson({"type": "meta", "sql_query": sql_query, "query_id": query_id,
+                               "columns": [chart_data["x_label"], chart_data["y_label"]]})
+                yield _ndjson({"type": "chart", "chart_data": chart_data})
+                failed = False
+                yield _ndjson(_done_event(chart_data["original_points"], chart_data["truncated"],
+                                          timings if include_timings else None))
+                return
+
+            cursor = queries.cursor(query_id, sql_query, max_rows=SQL_STREAM_MAX_ROWS)
+            with span("db"):
+                await run_blocking("db", cursor.open)
+            yield _ndjson({"type": "meta", "sql_query": sql_query, "query_id": query_id,
+                           "columns": cursor.columns})
+
+            summary = ResultSummary(cursor.columns)
+            while batch := await run_blocking("db", _fetch_summarized, cursor, summary):
+                yield _ndjson({"type": "rows", "rows": batch})
+            summary.truncated = cursor.truncated
+            await run_blocking("db", cursor.close)
+            QUERY_ROWS.observe(cursor.row_count, "table")
+
+        # The answer is streamed as it is generated instead of after the full response
+        async for text in stream_human_readable(user_prompt, summary):
+            yield _ndjson({"type": "answer", "text": text})
+        failed = False
+        yield _ndjson(_done_event(cursor.row_count, cursor.truncated, timings if include_timings else None))
 
     except Exception as e:
-        return {
-            "sql_query": "",
-            "db_result": {"columns": [], "rows": []},
-            "chart_data": None,
-            "human_answer": f"Sorry, an error occurred: {str(e)}",
-            "error": True
-        }
+        if sql_query is not None and not isinstance(e, QueryCancelled):
+            await forget_sql(messages, sql_query, chart_mode)
+        yield _ndjson({"type": "error", "message": f"Sorry, an error occurred: {str(e)}"})
+    finally:
+        # Client disconnects land here too; release the pooled connection
+        if cursor is not None:
+            await asyncio.shield(run_blocking("db", cursor.close))
+        metrics.finish_request("stream", timings, started, error=failed)
+
+def _fetch_summarized(cursor, summary):
+    with span("db"):
+        batch = cursor.fetch()
+    with span("summarize"):
+        summary.add(batch)
+    return batch
+
+def _done_event(row_count, truncated, timings=None):
+    event = {"type": "done", "row_count": row_count, "truncated": truncated}
+    if timings is not None:
+        event["timings"] = _rounded(timings)
+    return event
+
+def _rounded(timings):
+    return {stage: round(seconds, 4) for stage, seconds in timings.items()}
+
+def _ndjson(event):
+    return json.dumps(event, default=_json_default) + "\n"
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    return str(value)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _cache_metrics():
+    stats = sql_cache.stats()
+    pruning = catalog.prune_stats()
+    return [
+        ("sql_cache_hits_total", "counter", "Generated SQL served from the cache", stats["hits"]),
+        ("sql_cache_misses_total", "counter", "Questions that needed the model", stats["misses"]),
+        ("sql_cache_coalesced_total", "counter", "Requests that waited on an identical generation",
+         stats["coalesced"]),
+        ("sql_cache_hit_ratio", "gauge", "Share of lookups served from the cache", stats["hit_rate"]),
+        ("sql_cache_entries", "gauge", "Generated queries held in memory", stats["size"]),
+        ("schema_prompts_pruned_total", "counter", "Prompts sent with a pruned schema", pruning["pruned"]),
+        ("schema_prompts_full_total", "counter", "Prompts sent with the full schema", pruning["full"]),
+        ("schema_prompt_tokens_saved_total", "counter", "Schema tokens left out of prompts by pruning",
+         pruning["tokens_saved"]),
+    ]
+
+metrics.register_collector(_cache_metrics)
+
+@app.post("/chat/cancel/{query_id}")
+async def cancel_query(query_id: str):
+    """Stop a running /chat or /chat/stream query started with this query_id"""
+    cancelled = await run_blocking("cancel", queries.cancel, query_id)
+    return {"query_id": query_id, "cancelled": cancelled}
+
 @app.get("/list-uploads")
 async def list_uploads():
     return {"files": os.listdir("uploads")}
@@ -0,0 +1,155 @@
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a cache hit to a slow LLM call
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for labelvalues, (counts, total, count) in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                labels = _labels(self.labelnames + ("le",), labelvalues + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter in the Prometheus exposition format"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "Time spent per pipeline stage within one request", labelnames=("stage",))
+REQUEST_SECONDS = Histogram(
+    "request_seconds", "End-to-end time of a question through the pipeline", labelnames=("endpoint",))
+REQUEST_ERRORS = Counter("request_errors_total", "Questions that ended in an error", labelnames=("endpoint",))
+LLM_PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens", "Estimated tokens sent to the model", TOKEN_BUCKETS, labelnames=("call",))
+LLM_RESPONSE_TOKENS = Histogram(
+    "llm_response_tokens", "Estimated tokens received from the model", TOKEN_BUCKETS, labelnames=("call",))
+QUERY_ROWS = Histogram("query_rows", "Rows returned by generated queries", ROW_BUCKETS, labelnames=("kind",))
+LLM_ATTEMPTS = Counter("llm_attempts_total", "Requests sent to the model by outcome", labelnames=("model", "outcome"))
+LLM_HEDGES = Counter("llm_hedged_requests_total", "Duplicate requests sent for slow model calls", labelnames=("model",))
+
+_metrics = [STAGE_SECONDS, REQUEST_SECONDS, REQUEST_ERRORS, LLM_PROMPT_TOKENS, LLM_RESPONSE_TOKENS, QUERY_ROWS,
+            LLM_ATTEMPTS, LLM_HEDGES]
+_collectors = []
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def register_collector(collect):
+    """Add a callable returning (name, type, help, value) tuples, read on every scrape"""
+    _collectors.append(collect)
+
+
+def start_request():
+    """Collect stage timings for the current request; returns the {stage: seconds} dict.
+
+    Worker threads started through run_blocking and tasks started from
+    here inherit the context, so their spans land in the same dict.
+    """
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def finish_request(endpoint, timings, started, error=False):
+    """Record the stage totals and overall latency of a finished request"""
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage)
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint)
+    if error:
+        REQUEST_ERRORS.inc(1, endpoint)
+
+
+@contextmanager
+def span(stage):
+    """Time a pipeline stage; repeated spans of one stage in a request add up"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings = _request_timings.get()
+        if timings is None:
+            STAGE_SECONDS.observe(elapsed, stage)
+        else:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        for name, kind, help_text, value in collect():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {_number(value)}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,170 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2 import sql
+import smtplib
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from dotenv import load_dotenv
+import db
+
+load_dotenv()
+
+SMTP_SERVER = os.getenv("SMTP_SERVER")
+SMTP_PORT = os.getenv("SMTP_PORT")
+EMAIL_USER = os.getenv("EMAIL_USER")
+EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+EMAIL_TO = os.getenv("EMAIL_TO")
+
+REVENUE_MONITOR_ENABLED = os.getenv("REVENUE_MONITOR_ENABLED", "true").lower() == "true"
+REVENUE_THRESHOLD = float(os.getenv("REVENUE_THRESHOLD", "20000"))
+REVENUE_CHECK_INTERVAL = float(os.getenv("REVENUE_CHECK_INTERVAL", "300"))
+# Minimum time between two alerts while revenue stays below the threshold
+REVENUE_ALERT_COOLDOWN = float(os.getenv("REVENUE_ALERT_COOLDOWN", "3600"))
+# Monotonic column of sales_table (e.g. a serial id). When set, only rows past
+# the last seen value are summed; otherwise every check rescans the table.
+REVENUE_WATERMARK_COLUMN = os.getenv("REVENUE_WATERMARK_COLUMN")
+# Full rescan period that picks up updates/deletes the watermark cannot see
+REVENUE_RECONCILE_INTERVAL = float(os.getenv("REVENUE_RECONCILE_INTERVAL", "86400"))
+
+
+def send_revenue_alert(total_revenue):
+    """Send the low-revenue HTML email"""
+    subject = "⚠️ Revenue Alert: Low Revenue Detected!"
+    html_content = f"""
+    <html>
+    <body>
+     <h2 style="color: red;">Revenue Alert 🚨</h2>
+     <p>Dear Team,</p>
+     <p>The total revenue has dropped below the threshold.</p>
+     <p><strong>Current Revenue:</strong> ${total_revenue:,.2f}</p>
+     <p>Please take immediate action.</p>
+     <hr>
+     <p style="font-size:12px;color:gray;">This is an automated message from the Financial Monitoring System.</p>
+    </body>
+    </html>
+    """
+
+    message = MIMEMultipart('alternative')
+    message['From'] = EMAIL_USER
+    message['To'] = EMAIL_TO
+    message['Subject'] = subject
+    message.attach(MIMEText(html_content, 'html'))
+
+    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+        server.starttls()  # Secure the connection
+        server.login(EMAIL_USER, EMAIL_PASSWORD)
+        server.sendmail(EMAIL_USER, EMAIL_TO, message.as_string())
+
+    print("✅ Alert Email sent successfully.")
+
+
+class RevenueMonitor:
+    """Periodically checks total revenue and emails an alert when it drops too low"""
+
+    def __init__(self, threshold=REVENUE_THRESHOLD, interval=REVENUE_CHECK_INTERVAL,
+                 cooldown=REVENUE_ALERT_COOLDOWN, watermark_column=REVENUE_WATERMARK_COLUMN,
+                 reconcile_interval=REVENUE_RECONCILE_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.cooldown = cooldown
+        self.watermark_column = watermark_column
+        self.reconcile_interval = reconcile_interval
+
+        self.total_revenue = None
+        self._watermark = None
+        self._reconciled_at = 0.0
+        self._last_alert_at = None
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._mailer = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._mailer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="revenue-alert")
+        self._thread = threading.Thread(target=self._run, name="revenue-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._mailer is not None:
+            self._mailer.shutdown(wait=False)
+            self._mailer = None
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Revenue monitor error: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def check(self):
+        """Update the running revenue total and alert if needed"""
+        with db.connection(readonly=True) as conn:
+            with conn.cursor() as cur:
+                self._update_revenue(cur)
+        print(f"Total Revenue: {self.total_revenue}")
+        self._evaluate(self.total_revenue)
+
+    def _update_revenue(self, cur):
+        now = time.monotonic()
+        revenue = sql.SQL("SELECT COALESCE(SUM(quantity_sold * unit_price), 0)")
+
+        if not self.watermark_column:
+            cur.execute(sql.SQL("{} FROM sales_table").format(revenue))
+            self.total_revenue = cur.fetchone()[0]
+            return
+
+        column = sql.Identifier(self.watermark_column)
+        full_scan = (self._watermark is None
+                     or now - self._reconciled_at >= self.reconcile_interval)
+        if full_scan:
+            cur.execute(sql.SQL("{}, MAX({}) FROM sales_table").format(revenue, column))
+            self.total_revenue, self._watermark = cur.fetchone()
+            self._reconciled_at = now
+        else:
+            cur.execute(
+                sql.SQL("{}, MAX({}) FROM sales_table WHERE {} > %s").format(revenue, column, column),
+                (self._watermark,),
+            )
+            delta, watermark = cur.fetchone()
+            self.total_revenue += delta
+            if watermark is not None:
+                self._watermark = watermark
+
+    def _evaluate(self, total_revenue):
+        if total_revenue >= self.threshold:
+            if self._last_alert_at is not None:
+                print("✅ Revenue recovered above threshold.")
+            self._last_alert_at = None
+            return
+
+        now = time.monotonic()
+        if self._last_alert_at is not None and now - self._last_alert_at < self.cooldown:
+            return  # Already alerted for this low-revenue episode
+
+        self._last_alert_at = now
+        if self._mailer is None:
+            send_revenue_alert(total_revenue)
+            return
+        future = self._mailer.submit(send_revenue_alert, total_revenue)
+        future.add_done_callback(self._alert_done)
+
+    def _alert_done(self, future):
+        error = future.exception()
+        if error is not None:
+            print(f"Error sending revenue alert: {error}")
+            # Allow the next check to retry instead of waiting out the cooldown
+            self._last_alert_at = None
+
+
+monitor = RevenueMonitor()
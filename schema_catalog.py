@@ -0,0 +1,222 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+import db
+from schema_index import SchemaIndex
+from summarize import estimate_tokens
+
+load_dotenv()
+
+# Seconds between version probes; within this window the cached text is served as-is
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SCHEMA_CHECK_INTERVAL", "30"))
+# Hard upper bound on the age of the cached schema, regardless of the probe
+SCHEMA_TTL = float(os.getenv("SCHEMA_TTL", "3600"))
+
+SCHEMA_HEADER = "You must assume the following PostgreSQL database schema:\n\nTables:\n"
+
+# All base tables of the public schema, their columns and comments in a single round trip
+CATALOG_QUERY = """
+    SELECT c.relname, a.attname, format_type(a.atttypid, NULL),
+           obj_description(c.oid, 'pg_class'), col_description(c.oid, a.attnum)
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_catalog.pg_attribute a
+           ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+    ORDER BY c.relname, a.attnum
+"""
+
+# Foreign-key column pairs between public tables, one row per column
+FOREIGN_KEY_QUERY = """
+    SELECT c.relname, a.attname, rc.relname, ra.attname
+    FROM pg_catalog.pg_constraint k
+    JOIN pg_catalog.pg_class c ON c.oid = k.conrelid
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_catalog.pg_class rc ON rc.oid = k.confrelid
+    CROSS JOIN LATERAL unnest(k.conkey, k.confkey) AS u(attnum, refnum)
+    JOIN pg_catalog.pg_attribute a ON a.attrelid = k.conrelid AND a.attnum = u.attnum
+    JOIN pg_catalog.pg_attribute ra ON ra.attrelid = k.confrelid AND ra.attnum = u.refnum
+    WHERE k.contype = 'f' AND n.nspname = 'public'
+    ORDER BY c.relname, k.conname
+"""
+
+# Fingerprint of the public schema. Any CREATE/DROP/ALTER touches the pg_class,
+# pg_attribute or pg_constraint rows involved, and COMMENT ON the pg_description
+# rows, which changes their xmin.
+VERSION_QUERY = """
+    WITH rels AS (
+        SELECT c.oid, c.xmin
+        FROM pg_catalog.pg_class c
+        JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+    )
+    SELECT md5(
+        COALESCE((
+            SELECT string_agg(r.oid::text || ':' || r.xmin::text || ':' || COALESCE(a.attrs, ''),
+                              ',' ORDER BY r.oid)
+            FROM rels r
+            LEFT JOIN LATERAL (
+                SELECT string_agg(attnum::text || '.' || xmin::text, ';' ORDER BY attnum) AS attrs
+                FROM pg_catalog.pg_attribute
+                WHERE attrelid = r.oid AND attnum > 0
+            ) a ON true
+        ), '') || '|' ||
+        COALESCE((
+            SELECT string_agg(d.objoid::text || '.' || d.objsubid::text || ':' || d.xmin::text,
+                              ',' ORDER BY d.objoid, d.objsubid)
+            FROM pg_catalog.pg_description d
+            JOIN rels r ON r.oid = d.objoid
+            WHERE d.classoid = 'pg_catalog.pg_class'::regclass
+        ), '') || '|' ||
+        COALESCE((
+            SELECT string_agg(k.oid::text || ':' || k.xmin::text, ',' ORDER BY k.oid)
+            FROM pg_catalog.pg_constraint k
+            JOIN rels r ON r.oid = k.conrelid
+            WHERE k.contype = 'f'
+        ), '')
+    )
+"""
+
+
+def _comment(text):
+    """First line of a catalog comment, formatted as a prompt annotation"""
+    line = text.strip().splitlines()[0] if text and text.strip() else ""
+    return f" -- {line}" if line else ""
+
+
+def render_schema(tables, comments=None, foreign_keys=None):
+    """Render {table: [(column, type), ...]} as prompt text.
+
+    comments maps table names and (table, column) pairs to their comment;
+    foreign_keys maps (table, column) to the referenced (table, column) and is
+    only shown when the referenced table is part of the rendered set.
+    """
+    comments = comments or {}
+    foreign_keys = foreign_keys or {}
+    table_structure = SCHEMA_HEADER
+    for table_name, columns in tables.items():
+        table_structure += f"\n{table_name}{_comment(comments.get(table_name))}\n"
+        for column_name, data_type in columns:
+            line = f"- {column_name} ({data_type})"
+            ref = foreign_keys.get((table_name, column_name))
+            if ref and ref[0] in tables:
+                line += f" -> {ref[0]}.{ref[1]}"
+            table_structure += line + _comment(comments.get((table_name, column_name))) + "\n"
+    return table_structure
+
+
+class SchemaCatalog:
+    """In-memory copy of the public schema, revalidated by version probe or TTL"""
+
+    def __init__(self, check_interval=SCHEMA_CHECK_INTERVAL, ttl=SCHEMA_TTL):
+        self.check_interval = check_interval
+        self.ttl = ttl
+        self.tables = {}
+        self.comments = {}
+        self.foreign_keys = {}
+        self.index = None
+        self.text = ""
+        self.version = None
+        self._prune_stats = {"pruned": 0, "full": 0, "tokens_saved": 0}
+        self._stats_lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_fresh(self):
+        """True when get_text() can answer without touching the database"""
+        return self.version is not None and time.monotonic() - self._checked_at < self.check_interval
+
+    def get_text(self):
+        """Return the rendered schema, hitting the database only when due"""
+        if self.is_fresh():
+            return self.text
+        with self._lock:
+            now = time.monotonic()
+            if self.version is None or now - self._checked_at >= self.check_interval:
+                self._revalidate(now)
+        return self.text
+
+    def select_text(self, question):
+        """Cached schema limited to the tables relevant to question, or all of it when unsure"""
+        text = self.text
+        index = self.index
+        selected = index.select(question) if index is not None else None
+        if selected is None:
+            with self._stats_lock:
+                self._prune_stats["full"] += 1
+            return text
+
+        pruned = render_schema({name: self.tables[name] for name in selected},
+                               self.comments, self.foreign_keys)
+        saved = estimate_tokens(text) - estimate_tokens(pruned)
+        with self._stats_lock:
+            self._prune_stats["pruned"] += 1
+            self._prune_stats["tokens_saved"] += saved
+        print(f"Schema pruned to {len(selected)}/{len(self.tables)} tables, ~{saved} prompt tokens saved")
+        return pruned
+
+    def prune_stats(self):
+        with self._stats_lock:
+            stats = dict(self._prune_stats)
+        stats["full_schema_tokens"] = estimate_tokens(self.text) if self.text else 0
+        stats["avg_tokens_saved"] = stats["tokens_saved"] / stats["pruned"] if stats["pruned"] else 0.0
+        return stats
+
+    def refresh(self):
+        """Reload the catalog unconditionally"""
+        with self._lock:
+            with db.connection(readonly=True) as conn:
+                self._load(conn, self._probe(conn))
+        return self.text
+
+    def _revalidate(self, now):
+        try:
+            with db.connection(readonly=True) as conn:
+                version = self._probe(conn)
+                if version != self.version or now - self._loaded_at >= self.ttl:
+                    self._load(conn, version)
+                else:
+                    self._checked_at = now
+        except Exception as e:
+            # Keep serving the last known schema; retry on the next interval
+            print(f"Error fetching table structure: {e}")
+            self._checked_at = now
+
+    def _probe(self, conn):
+        with conn.cursor() as cur:
+            cur.execute(VERSION_QUERY)
+            return cur.fetchone()[0]
+
+    def _load(self, conn, version):
+        with conn.cursor() as cur:
+            cur.execute(CATALOG_QUERY)
+            rows = cur.fetchall()
+            cur.execute(FOREIGN_KEY_QUERY)
+            fk_rows = cur.fetchall()
+
+        tables = {}
+        comments = {}
+        for table_name, column_name, data_type, table_comment, column_comment in rows:
+            columns = tables.setdefault(table_name, [])
+            if table_comment:
+                comments[table_name] = table_comment
+            if column_name is not None:
+                columns.append((column_name, data_type))
+                if column_comment:
+                    comments[(table_name, column_name)] = column_comment
+        foreign_keys = {(table, column): (ref_table, ref_column)
+                        for table, column, ref_table, ref_column in fk_rows}
+
+        self.tables = tables
+        self.comments = comments
+        self.foreign_keys = foreign_keys
+        self.index = SchemaIndex(tables, comments, foreign_keys)
+        self.text = render_schema(tables, comments, foreign_keys)
+        self.version = version
+        self._loaded_at = self._checked_at = time.monotonic()
+        print(f"Schema catalog loaded: {len(tables)} tables (version {version[:8]})")
+
+
+catalog = SchemaCatalog()
@@ -0,0 +1,144 @@
+import os
+import math
+from collections import deque
+from dotenv import load_dotenv
+from example_index import tokenize
+
+load_dotenv()
+
+# Schemas with at most this many tables are always sent whole
+SCHEMA_PRUNE_MIN_TABLES = int(os.getenv("SCHEMA_PRUNE_MIN_TABLES", "15"))
+# Most tables picked directly from the question, before foreign-key expansion
+SCHEMA_PRUNE_MAX_TABLES = int(os.getenv("SCHEMA_PRUNE_MAX_TABLES", "8"))
+# Runner-up score, as a fraction of the best, above which the match is ambiguous
+SCHEMA_PRUNE_AMBIGUITY = float(os.getenv("SCHEMA_PRUNE_AMBIGUITY", "0.8"))
+# Score below which the remaining question terms are not taken to name a table
+SCHEMA_PRUNE_MIN_SCORE = float(os.getenv("SCHEMA_PRUNE_MIN_SCORE", "2.0"))
+# Longest foreign-key path searched when connecting two selected tables
+SCHEMA_PRUNE_MAX_HOPS = int(os.getenv("SCHEMA_PRUNE_MAX_HOPS", "2"))
+
+# How much a match counts depending on where the term appears
+TABLE_NAME_WEIGHT = 3.0
+COLUMN_NAME_WEIGHT = 1.0
+COMMENT_WEIGHT = 0.5
+
+
+def identifier_tokens(name):
+    """Tokens of an identifier, both whole and split on underscores"""
+    tokens = tokenize(name.replace("_", " "))
+    if "_" in name:
+        tokens += tokenize(name)
+    return tokens
+
+
+class SchemaIndex:
+    """Relevance index over table and column names, comments and foreign keys.
+
+    Each table is scored against the question with idf-weighted term matches,
+    counting a hit in the table name more than one in a column or comment.
+    Tables are picked greedily until the question terms are covered, then
+    joined up through the foreign-key graph.
+    select() returns None whenever the match is too weak or too ambiguous to
+    trust, and the caller sends the full schema instead.
+    """
+
+    def __init__(self, tables, comments=None, foreign_keys=None):
+        comments = comments or {}
+        foreign_keys = foreign_keys or {}
+        self.names = list(tables)
+        self._postings = {}
+        self._outgoing = {name: set() for name in self.names}
+        self._neighbours = {name: set() for name in self.names}
+
+        for name, columns in tables.items():
+            weights = {}
+            self._weigh(weights, identifier_tokens(name), TABLE_NAME_WEIGHT)
+            self._weigh(weights, tokenize(comments.get(name) or ""), COMMENT_WEIGHT)
+            for column_name, _ in columns:
+                self._weigh(weights, identifier_tokens(column_name), COLUMN_NAME_WEIGHT)
+                self._weigh(weights, tokenize(comments.get((name, column_name)) or ""), COMMENT_WEIGHT)
+            for token, weight in weights.items():
+                self._postings.setdefault(token, {})[name] = weight
+
+        for (table, _), (ref_table, _) in foreign_keys.items():
+            if table in self._outgoing and ref_table in self._outgoing and table != ref_table:
+                self._outgoing[table].add(ref_table)
+                self._neighbours[table].add(ref_table)
+                self._neighbours[ref_table].add(table)
+
+        n = len(self.names)
+        self._idf = {token: math.log(1.0 + n / len(postings)) for token, postings in self._postings.items()}
+
+    @staticmethod
+    def _weigh(weights, tokens, weight):
+        for token in tokens:
+            if weights.get(token, 0.0) < weight:
+                weights[token] = weight
+
+    def scores(self, tokens, exclude=()):
+        """{table: score} for every table sharing one of tokens, except those in exclude"""
+        scores = {}
+        for token in tokens:
+            idf = self._idf[token]
+            for table, weight in self._postings[token].items():
+                if table not in exclude:
+                    scores[table] = scores.get(table, 0.0) + idf * weight
+        return scores
+
+    def select(self, question):
+        """Names of the tables needed for question, or None to use the full schema"""
+        if len(self.names) <= SCHEMA_PRUNE_MIN_TABLES:
+            return None
+
+        # Greedy cover of the question terms: take the best table, drop the terms
+        # it matches and repeat while the remaining terms still point somewhere
+        remaining = {token for token in identifier_tokens(question) if token in self._postings}
+        seeds = []
+        while remaining and len(seeds) < SCHEMA_PRUNE_MAX_TABLES:
+            scores = self.scores(remaining, seeds)
+            if not scores:
+                break
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            best = scores[ranked[0]]
+            if best < SCHEMA_PRUNE_MIN_SCORE:
+                if not seeds:
+                    return None
+                break
+            if len(ranked) > 1 and scores[ranked[1]] >= best * SCHEMA_PRUNE_AMBIGUITY:
+                # Two tables match about equally well; the question does not say which
+                return None
+            seeds.append(ranked[0])
+            remaining = {token for token in remaining if ranked[0] not in self._postings[token]}
+        if not seeds:
+            return None
+
+        selected = set(seeds)
+        for table in seeds:
+            selected |= self._outgoing[table]
+        for i, table in enumerate(seeds):
+            for other in seeds[i + 1:]:
+                selected.update(self._path(table, other))
+
+        if len(selected) * 2 > len(self.names):
+            return None
+        return [name for name in self.names if name in selected]
+
+    def _path(self, start, goal):
+        """Tables on a shortest foreign-key path between two tables, if one is short enough"""
+        parents = {start: None}
+        queue = deque([(start, 0)])
+        while queue:
+            table, depth = queue.popleft()
+            if table == goal:
+                path = []
+                while table is not None:
+                    path.append(table)
+                    table = parents[table]
+                return path
+            if depth >= SCHEMA_PRUNE_MAX_HOPS:
+                continue
+            for neighbour in self._neighbours[table]:
+                if neighbour not in parents:
+                    parents[neighbour] = table
+                    queue.append((neighbour, depth + 1))
+        return []
@@ -0,0 +1,171 @@
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from concurrency import run_blocking
+
+load_dotenv()
+
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "1000"))
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", "86400"))
+# Optional SQLite file that keeps generated SQL across restarts
+SQL_CACHE_PATH = os.getenv("SQL_CACHE_PATH")
+
+
+def normalize_question(text):
+    """Canonical form of a question: case, spacing and trailing punctuation ignored"""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip("?!. ")
+
+
+class SQLCache:
+    """LRU/TTL cache of generated SQL with optional disk backing and request coalescing.
+
+    The in-memory entries are read and written on the event loop; the SQLite
+    file, when configured, is only touched from io-stage worker threads.
+    """
+
+    def __init__(self, maxsize=SQL_CACHE_SIZE, ttl=SQL_CACHE_TTL, path=SQL_CACHE_PATH):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        self._purged_at = 0.0
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS sql_cache (key TEXT PRIMARY KEY, sql TEXT, created REAL)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS sql_cache_created ON sql_cache (created)")
+            self._disk.commit()
+
+    @staticmethod
+    def make_key(question, chart_mode, schema_version, examples_version=0):
+        """Key for a question; new training examples or a schema change give new keys"""
+        return f"{schema_version}|{examples_version}|{int(bool(chart_mode))}|{normalize_question(question)}"
+
+    async def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                sql, created = entry
+                if now - created < self.ttl:
+                    self._entries.move_to_end(key)
+                    return sql
+                del self._entries[key]
+
+        if self._disk is not None:
+            row = await run_blocking("io", self._disk_get, key)
+            if row is not None and now - row[1] < self.ttl:
+                with self._lock:
+                    self._remember(key, row[0], row[1])
+                return row[0]
+        return None
+
+    async def put(self, key, sql):
+        created = time.time()
+        with self._lock:
+            self._remember(key, sql, created)
+        if self._disk is not None:
+            await run_blocking("io", self._disk_put, key, sql, created)
+
+    async def discard(self, key, sql=None):
+        """Forget the entry for key, only if it still holds sql when that is given"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (sql is None or entry[0] == sql):
+                del self._entries[key]
+        if self._disk is not None:
+            await run_blocking("io", self._disk_discard, key, sql)
+
+    async def get_or_generate(self, key, generate):
+        """Return cached SQL for key, or await generate() once for all concurrent callers"""
+        task = self._inflight.get(key)
+        if task is None:
+            sql = await self.get(key)
+            if sql is not None:
+                self.hits += 1
+                return sql
+            # Another caller may have started generating while the disk was read
+            task = self._inflight.get(key)
+
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = self._inflight[key] = asyncio.ensure_future(self._generate(key, generate))
+        # Shielded so a disconnecting caller does not cancel the shared generation
+        return await asyncio.shield(task)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute("DELETE FROM sql_cache")
+                self._disk.commit()
+
+    async def _generate(self, key, generate):
+        try:
+            sql = await generate()
+            await self.put(key, sql)
+            return sql
+        finally:
+            self._inflight.pop(key, None)
+
+    def _remember(self, key, sql, created):
+        self._entries[key] = (sql, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key):
+        with self._disk_lock:
+            return self._disk.execute(
+                "SELECT sql, created FROM sql_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _disk_put(self, key, sql, created):
+        with self._disk_lock:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO sql_cache (key, sql, created) VALUES (?, ?, ?)",
+                (key, sql, created),
+            )
+            # Expired rows are never served, so purging them at most hourly is enough
+            if created - self._purged_at > min(self.ttl, 3600):
+                self._disk.execute("DELETE FROM sql_cache WHERE created < ?", (created - self.ttl,))
+                self._purged_at = created
+            self._disk.commit()
+
+    def _disk_discard(self, key, sql):
+        with self._disk_lock:
+            if sql is None:
+                self._disk.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+            else:
+                self._disk.execute("DELETE FROM sql_cache WHERE key = ? AND sql = ?", (key, sql))
+            self._disk.commit()
+
+
+sql_cache = SQLCache()
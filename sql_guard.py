@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+from psycopg2 import extensions
+from dotenv import load_dotenv
+import db
+
+load_dotenv()
+
+# Planner cost above which a generated query is refused (0 disables the check)
+SQL_GUARD_MAX_COST = float(os.getenv("SQL_GUARD_MAX_COST", "50000000"))
+# Wrap queries expected to return more rows than the caller keeps in a LIMIT;
+# when off they are refused instead
+SQL_GUARD_AUTO_LIMIT = os.getenv("SQL_GUARD_AUTO_LIMIT", "true").lower() == "true"
+# statement_timeout for generated queries, applied to each statement and fetch
+SQL_GUARD_TIMEOUT_MS = int(os.getenv("SQL_GUARD_TIMEOUT_MS", "15000"))
+
+_TOKEN_RE = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>[Ee]'(?:[^'\\]|\\.|'')*'|(?:[BbXxNn]|[Uu]&)?'(?:[^']|'')*')
+  | (?P<ident>"(?:[^"]|"")*")
+  | (?P<dollar>\$(?P<tag>[A-Za-z_][A-Za-z0-9_]*|)\$.*?\$(?P=tag)\$)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<semicolon>;)
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.S | re.X)
+
+STATEMENT_KEYWORDS = {"select", "with", "values", "table"}
+# Keywords that make an otherwise read-only statement write or lock
+WRITE_KEYWORDS = {"insert", "update", "delete", "merge", "into", "truncate", "drop", "alter",
+                  "create", "grant", "revoke", "copy"}
+# Functions with side effects outside the transaction, or that can stall the server
+BLOCKED_FUNCTIONS = {"pg_sleep", "pg_sleep_for", "pg_sleep_until", "pg_terminate_backend",
+                     "pg_cancel_backend", "pg_reload_conf", "pg_read_file", "pg_read_binary_file",
+                     "pg_ls_dir", "pg_stat_file", "lo_import", "lo_export", "set_config",
+                     "nextval", "setval", "dblink", "dblink_exec", "query_to_xml"}
+BLOCKED_FUNCTION_PREFIXES = ("pg_advisory", "pg_try_advisory", "dblink_")
+
+
+class QueryRejected(Exception):
+    """The generated SQL was refused before it reached the database"""
+
+
+class QueryCancelled(Exception):
+    """The query was cancelled by the client"""
+
+
+class QueryTimeout(Exception):
+    """The query ran past its statement_timeout"""
+
+
+def _words(sql_query):
+    """Lowercased words and the ";" and "(" markers of a query; literals and symbols become "" """
+    words = []
+    for match in _TOKEN_RE.finditer(sql_query):
+        kind = match.lastgroup
+        if kind == "word":
+            words.append(match.group().lower())
+        elif kind == "semicolon":
+            words.append(";")
+        elif kind == "other":
+            words.append("(" if match.group() == "(" else "")
+        elif kind in ("string", "ident", "dollar"):
+            words.append("")
+    return words
+
+
+def check_statement(sql_query):
+    """Return sql_query without trailing semicolons and comments if it is a single read-only statement"""
+    words = _words(sql_query)
+    while words and words[-1] == ";":
+        words.pop()
+    first = next((w for w in words if w), "")
+    if not first:
+        raise QueryRejected("Empty query")
+    if first not in STATEMENT_KEYWORDS:
+        raise QueryRejected(f"Only read-only SELECT queries are allowed, got {first.upper()}")
+    if ";" in words:
+        raise QueryRejected("Only a single statement is allowed")
+
+    for i, word in enumerate(words):
+        if word in WRITE_KEYWORDS:
+            raise QueryRejected(f"{word.upper()} is not allowed in a read-only query")
+        if word == "share" and i and words[i - 1] in ("for", "key"):
+            raise QueryRejected("Row locking clauses are not allowed")
+        if i + 1 < len(words) and words[i + 1] == "(" and (
+                word in BLOCKED_FUNCTIONS or word.startswith(BLOCKED_FUNCTION_PREFIXES)):
+            raise QueryRejected(f"Function {word}() is not allowed")
+
+    # Cut after the last real token so trailing comments and semicolons go too
+    end = 0
+    for match in _TOKEN_RE.finditer(sql_query):
+        if match.lastgroup not in ("comment", "space", "semicolon"):
+            end = match.end()
+    return sql_query[:end].strip()
+
+
+def explain(conn, sql_query):
+    """Planner estimate for sql_query as (total cost, rows); nothing is executed"""
+    with conn.cursor() as cur:
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql_query)
+        plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]["Plan"]
+    return root["Total Cost"], root["Plan Rows"]
+
+
+def review(conn, sql_query, max_rows=None, max_cost=SQL_GUARD_MAX_COST, auto_limit=SQL_GUARD_AUTO_LIMIT):
+    """Check sql_query against the planner's estimate; returns the SQL to run.
+
+    Queries expected to return more than max_rows rows are wrapped in a LIMIT,
+    which also lets the planner stop early, or refused when auto_limit is off.
+    The cost limit is applied to the query that will actually run.
+    """
+    sql_query = check_statement(sql_query)
+    cost, rows = explain(conn, sql_query)
+    if max_rows is not None and rows > max_rows:
+        if not auto_limit:
+            raise QueryRejected(f"Query would return about {rows} rows (limit {max_rows})")
+        # One extra row so the caller can still tell the result was cut short
+        # The newline keeps a comment inside the query from swallowing the closing parenthesis
+        sql_query = f"SELECT * FROM ({sql_query}\n) AS guarded_query LIMIT {max_rows + 1}"
+        print(f"SQL guard: added LIMIT {max_rows + 1} to a query estimated at {rows} rows")
+        cost, rows = explain(conn, sql_query)
+    if max_cost and cost > max_cost:
+        raise QueryRejected(f"Query is too expensive to run (estimated cost {cost:.0f}, limit {max_cost:.0f})")
+    return sql_query
+
+
+class QueryRegistry:
+    """Running queries by client-chosen id, so they can be cancelled from another request"""
+
+    def __init__(self):
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, query_id=None):
+        """Register query_id for the duration of a request; yields the id in use.
+
+        A cancel that arrives before the query reaches the database is kept and
+        applied when it does. Cancellations and timeouts surface as
+        QueryCancelled and QueryTimeout.
+        """
+        query_id = query_id or uuid.uuid4().hex
+        entry = {"cursor": None, "cancelled": False}
+        with self._lock:
+            self._queries[query_id] = entry
+        try:
+            yield query_id
+        except extensions.QueryCanceledError as e:
+            if entry["cancelled"]:
+                raise QueryCancelled("Query cancelled") from e
+            raise QueryTimeout("Query took too long and was stopped") from e
+        finally:
+            with self._lock:
+                if self._queries.get(query_id) is entry:
+                    del self._queries[query_id]
+
+    def cursor(self, query_id, sql_query, max_rows=None, timeout_ms=SQL_GUARD_TIMEOUT_MS):
+        """Guarded ServerCursor for a tracked query"""
+        cursor = db.ServerCursor(
+            sql_query, max_rows=max_rows, timeout_ms=timeout_ms,
+            prepare=lambda conn, sql: review(conn, sql, max_rows),
+        )
+        with self._lock:
+            entry = self._queries.get(query_id)
+            if entry is not None:
+                entry["cursor"] = cursor
+                if entry["cancelled"]:
+                    cursor.cancel()
+        return cursor
+
+    def cancel(self, query_id):
+        """Cancel a tracked query; returns False if the id is unknown or already finished"""
+        with self._lock:
+            entry = self._queries.get(query_id)
+            if entry is None:
+                return False
+            entry["cancelled"] = True
+            cursor = entry["cursor"]
+        if cursor is not None:
+            cursor.cancel()
+        return True
+
+
+queries = QueryRegistry()
@@ -0,0 +1,158 @@
+import os
+from collections import Counter, deque
+from datetime import date, datetime
+from decimal import Decimal
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Approximate token budget for the result section of the answer prompt
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "1500"))
+SUMMARY_HEAD_ROWS = int(os.getenv("SUMMARY_HEAD_ROWS", "20"))
+SUMMARY_TAIL_ROWS = int(os.getenv("SUMMARY_TAIL_ROWS", "5"))
+# Distinct values tracked per column before it is treated as high-cardinality
+SUMMARY_MAX_DISTINCT = int(os.getenv("SUMMARY_MAX_DISTINCT", "1000"))
+SUMMARY_TOP_VALUES = 5
+
+
+def estimate_tokens(text):
+    """Rough token count; about four characters per token for English and SQL"""
+    return len(text) // 4 + 1
+
+
+def _fmt(value):
+    if isinstance(value, (float, Decimal)):
+        return f"{float(value):.6g}"
+    return str(value)
+
+
+class _ColumnStats:
+    def __init__(self, name):
+        self.name = name
+        self.kind = None
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+        self.values = Counter()
+        self.high_cardinality = False
+
+    def add(self, column):
+        values = [v for v in column if v is not None]
+        self.nulls += len(column) - len(values)
+        if not values:
+            return
+        if self.kind is None:
+            first = values[0]
+            if isinstance(first, (int, float, Decimal)) and not isinstance(first, bool):
+                self.kind = "numeric"
+            elif isinstance(first, (date, datetime)):
+                self.kind = "temporal"
+            else:
+                self.kind = "text"
+
+        self.count += len(values)
+        try:
+            if self.kind in ("numeric", "temporal"):
+                low, high = min(values), max(values)
+                self.min = low if self.min is None else min(self.min, low)
+                self.max = high if self.max is None else max(self.max, high)
+            if self.kind == "numeric":
+                self.sum += sum(values)
+        except TypeError:
+            # Mixed types in one column; keep what was gathered so far
+            self.kind = "text"
+
+        if self.kind == "text" and not self.high_cardinality:
+            self.values.update(str(v) for v in values)
+            if len(self.values) > SUMMARY_MAX_DISTINCT:
+                self.high_cardinality = True
+                self.values = Counter(dict(self.values.most_common(SUMMARY_TOP_VALUES)))
+
+    def describe(self):
+        details = []
+        if self.kind == "numeric" and self.count:
+            details.append(f"min {_fmt(self.min)}, max {_fmt(self.max)}, sum {_fmt(self.sum)}, "
+                           f"mean {_fmt(float(self.sum) / self.count)}")
+        elif self.kind == "temporal" and self.count:
+            details.append(f"from {self.min} to {self.max}")
+        if self.kind == "text" and self.values:
+            distinct = f"over {SUMMARY_MAX_DISTINCT}" if self.high_cardinality else str(len(self.values))
+            top = ", ".join(f"{value} ({n})" for value, n in self.values.most_common(SUMMARY_TOP_VALUES))
+            details.append(f"{distinct} distinct, most common: {top}")
+        if self.nulls:
+            details.append(f"{self.nulls} nulls")
+        line = f"- {self.name} ({self.kind or 'empty'})"
+        return line + ": " + "; ".join(details) if details else line
+
+
+class ResultSummary:
+    """Aggregates, per-column statistics and head/tail samples of a query result.
+
+    Built batch by batch in constant memory, so it can follow a streamed
+    result of any size and still render a prompt of bounded length.
+    """
+
+    def __init__(self, columns, head_rows=SUMMARY_HEAD_ROWS, tail_rows=SUMMARY_TAIL_ROWS):
+        self.columns = list(columns)
+        self.row_count = 0
+        self.truncated = False
+        self.head = []
+        self.tail = deque(maxlen=tail_rows)
+        self._head_rows = head_rows
+        self._stats = [_ColumnStats(name) for name in self.columns]
+
+    def add(self, rows):
+        if not rows:
+            return
+        self.row_count += len(rows)
+        room = self._head_rows - len(self.head)
+        if room > 0:
+            self.head.extend(rows[:room])
+            rows_for_tail = rows[room:]
+        else:
+            rows_for_tail = rows
+        self.tail.extend(rows_for_tail)
+        for stats, column in zip(self._stats, zip(*rows)):
+            stats.add(column)
+
+    def render(self, token_budget=SUMMARY_TOKEN_BUDGET):
+        """Prompt text describing the result within roughly token_budget tokens"""
+        text = f"Rows returned: {self.row_count}"
+        if self.truncated:
+            text += " (row limit reached; statistics cover the returned rows only)"
+        text += "\nColumns:\n"
+        for stats in self._stats:
+            line = stats.describe() + "\n"
+            if estimate_tokens(text + line) > token_budget:
+                text += f"- ... {len(self._stats)} columns in total\n"
+                break
+            text += line
+
+        sections = [("First rows" if self.tail else "All rows", self.head),
+                    ("Last rows", list(self.tail))]
+        for title, rows in sections:
+            if not rows:
+                continue
+            section = f"\n{title}:\n{', '.join(self.columns)}\n"
+            if estimate_tokens(text + section) > token_budget:
+                break
+            shown = 0
+            for row in rows:
+                line = ", ".join(_fmt(item) for item in row) + "\n"
+                if estimate_tokens(text + section + line) > token_budget:
+                    break
+                section += line
+                shown += 1
+            if shown:
+                text += section
+        return text
+
+
+def summarize_result(db_result):
+    """ResultSummary for an already materialized {"columns", "rows"} result"""
+    summary = ResultSummary(db_result["columns"])
+    summary.add(db_result["rows"])
+    summary.truncated = db_result.get("truncated", False)
+    return summary
@@ -0,0 +1,37 @@
+import asyncio
+import threading
+import contextvars
+import concurrency
+from concurrency import run_blocking, STAGE_LIMITS
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def test_busy_stage_does_not_starve_another():
+    release = threading.Event()
+
+    async def scenario():
+        blocked = [asyncio.ensure_future(run_blocking("db", release.wait, 5))
+                   for _ in range(STAGE_LIMITS["db"])]
+        await asyncio.sleep(0.05)
+        try:
+            # Every db worker is busy; io and cancel still get threads of their own
+            assert await asyncio.wait_for(run_blocking("io", lambda: "io"), 1) == "io"
+            assert await asyncio.wait_for(run_blocking("cancel", lambda: "cancel"), 1) == "cancel"
+        finally:
+            release.set()
+            await asyncio.gather(*blocked)
+
+    asyncio.run(scenario())
+
+
+def test_context_reaches_worker_threads():
+    async def scenario():
+        request_id.set("abc")
+        return await run_blocking("io", request_id.get)
+
+    assert asyncio.run(scenario()) == "abc"
+
+
+def test_stage_pool_is_sized_to_its_limit():
+    assert concurrency.executor("io")._max_workers == STAGE_LIMITS["io"]
@@ -0,0 +1,112 @@
+import json
+import random
+import pytest
+import dataset_ingest
+from dataset_ingest import dataset_hash, iter_examples
+
+VALID = [
+    {"natural_language": ["a", "b"], "sql": ["SELECT 1", "SELECT 2"]},
+    {"sql": ["x"], "natural_language": ["q"]},
+    {"natural_language": [], "sql": []},
+    {"meta": {"n": [1, 2.5e3, True, None, {"x": "]}"}]}, "natural_language": ["é \"quoted\" , ] }"],
+     "tags": [], "sql": ["SELECT '{'"], "z": -0.5},
+]
+
+MALFORMED = [
+    '{"natural_language":["a"],"sql":["b"]',
+    '{"natural_language":["a"],"sql":["b"]} trailing',
+    '{"natural_language":["a"],"sql":["b"]}{}',
+    '{"natural_language":["a"],"sql":["b"],}',
+    '{"natural_language":["a"] "sql":["b"]}',
+    '{"natural_language":["a",],"sql":["b"]}',
+    '{"natural_language":["a"],"sql":["b"],"x":{"y":1 "z":2}}',
+    '{"natural_language":["a"],"sql":["b"],"x":[1 2]}',
+    '{"natural_language":["a"],"sql":["b"],"x":tru}',
+    '{natural_language:["a"],"sql":["b"]}',
+    '["a"]',
+    '',
+]
+
+INVALID_DATASETS = [
+    '{"natural_language":["a","b"],"sql":["x"]}',
+    '{"natural_language":["a"],"sql":["x","y"]}',
+    '{"natural_language":["a"]}',
+    '{"sql":["x"]}',
+    '{"natural_language":[1],"sql":["x"]}',
+    '{"natural_language":["a"],"sql":[null]}',
+]
+
+
+def reference(text):
+    """What the upload should yield, following json.loads; None if it must be rejected"""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    nl, sql = data.get("natural_language"), data.get("sql")
+    if not isinstance(nl, list) or not isinstance(sql, list) or len(nl) != len(sql):
+        return None
+    if not all(isinstance(v, str) for v in nl + sql):
+        return None
+    return list(zip(nl, sql))
+
+
+def parse(path):
+    try:
+        return list(iter_examples(path))
+    except ValueError:
+        return None
+
+
+def write(tmp_path, text):
+    path = tmp_path / "dataset.json"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64])
+def test_matches_json_loads_at_every_chunk_size(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(dataset_ingest, "UPLOAD_CHUNK_SIZE", chunk_size)
+    documents = [json.dumps(d) for d in VALID] + [json.dumps(d, indent=2) for d in VALID]
+    documents += MALFORMED + INVALID_DATASETS
+    for text in documents:
+        assert parse(write(tmp_path, text)) == reference(text), text
+
+
+def test_fuzzed_documents_match_json_loads(tmp_path, monkeypatch):
+    rng = random.Random(7)
+    base = json.dumps(VALID[3])
+    for _ in range(300):
+        monkeypatch.setattr(dataset_ingest, "UPLOAD_CHUNK_SIZE", rng.randint(1, 16))
+        chars = list(base)
+        for _ in range(rng.randint(1, 2)):
+            i = rng.randrange(len(chars))
+            op = rng.choice(("drop", "dup", "swap"))
+            if op == "drop":
+                del chars[i]
+            elif op == "dup":
+                chars.insert(i, chars[i])
+            else:
+                chars[i] = rng.choice('{}[],:" x1')
+        text = "".join(chars)
+        assert parse(write(tmp_path, text)) == reference(text), text
+
+
+def test_dataset_hash_ignores_formatting(tmp_path):
+    compact = dataset_hash(write(tmp_path, json.dumps(VALID[0])))
+    indented = dataset_hash(write(tmp_path, json.dumps(VALID[0], indent=4)))
+    assert compact == indented
+    assert compact[1] == 2
+
+
+@pytest.mark.parametrize("text, message", [
+    (MALFORMED[0], "Invalid JSON"),
+    (MALFORMED[1], "extra data"),
+    (INVALID_DATASETS[0], "same length"),
+    (INVALID_DATASETS[2], "Missing key: sql"),
+])
+def test_dataset_hash_rejects(tmp_path, text, message):
+    with pytest.raises(ValueError, match=message):
+        dataset_hash(write(tmp_path, text))
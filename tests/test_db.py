@@ -0,0 +1,152 @@
+import threading
+import pytest
+from psycopg2 import extensions
+import db
+
+
+class FakeConnection:
+    """Just enough of a psycopg2 connection for the pool and ServerCursor"""
+
+    def __init__(self, rows=()):
+        self.closed = 0
+        self.readonly = False
+        self.rows = list(rows)
+        self.cancels = 0
+        self.info = self
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def cancel(self):
+        self.cancels += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.closed = False
+        self.description = [("n",)]
+        self.itersize = None
+        self._position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchmany(self, size):
+        rows = self.conn.rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    connections = []
+
+    def connect(**params):
+        conn = FakeConnection()
+        connections.append(conn)
+        return conn
+
+    monkeypatch.setattr(db.psycopg2, "connect", connect)
+    return connections
+
+
+def test_pool_reuses_idle_connections_under_concurrency(opened):
+    pool = db.ConnectionPool(minconn=1, maxconn=8, timeout=5)
+    barrier = threading.Barrier(8)
+
+    def checkout():
+        with pool.connection():
+            barrier.wait(timeout=5)
+
+    for _ in range(5):
+        threads = [threading.Thread(target=checkout) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert len(opened) == 8
+    assert not any(conn.closed for conn in opened)
+    pool.close()
+    assert all(conn.closed for conn in opened)
+
+
+def test_pool_replaces_closed_and_stale_connections(opened, monkeypatch):
+    pool = db.ConnectionPool(minconn=1, maxconn=2, healthcheck_interval=0)
+    first = opened[0]
+    monkeypatch.setattr(pool, "_ping", lambda conn: False)
+    with pool.connection() as conn:
+        assert conn is not first
+    assert first.closed
+
+    monkeypatch.setattr(pool, "_ping", lambda conn: True)
+    with pool.connection() as conn:
+        conn.closed = 1
+    with pool.connection() as conn:
+        assert not conn.closed
+    assert len(opened) == 3
+
+
+@pytest.fixture
+def fake_connection(monkeypatch):
+    conn = FakeConnection(rows=[(i,) for i in range(10)])
+
+    class Context:
+        def __enter__(self):
+            return conn
+
+        def __exit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(db, "connection", lambda readonly=False, timeout_ms=None: Context())
+    return conn
+
+
+def test_server_cursor_fetches_in_batches_up_to_the_cap(fake_connection):
+    with db.ServerCursor("SELECT n FROM t", batch_size=4, max_rows=6) as cursor:
+        batches = []
+        while batch := cursor.fetch():
+            batches.append(batch)
+    assert [len(b) for b in batches] == [4, 2]
+    assert cursor.truncated
+
+
+def test_cancel_between_fetches_stops_the_query(fake_connection):
+    with db.ServerCursor("SELECT n FROM t", batch_size=2) as cursor:
+        assert cursor.fetch()
+        cursor.cancel()
+        with pytest.raises(extensions.QueryCanceledError):
+            cursor.fetch()
+    assert fake_connection.cancels == 1
+
+
+def test_cancel_during_prepare_stops_before_declare(fake_connection):
+    cursor = db.ServerCursor("SELECT n FROM t")
+
+    def prepare(conn, sql):
+        cursor.cancel()
+        return sql
+
+    cursor.prepare = prepare
+    with pytest.raises(extensions.QueryCanceledError):
+        cursor.open()
+    assert cursor._cursor is None
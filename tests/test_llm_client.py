@@ -0,0 +1,163 @@
+import asyncio
+import pytest
+from google.api_core import exceptions as google_exceptions
+import concurrency
+import llm_client
+from llm_client import LLMClient, LLMUnavailable, CircuitBreaker
+from metrics import LLM_HEDGES
+
+
+class Reply:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Replays a script of (delay, outcome) steps, then answers quickly"""
+
+    def __init__(self, *script, text="SELECT 1"):
+        self.script = list(script)
+        self.text = text
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.calls += 1
+        delay, outcome = self.script.pop(0) if self.script else (0, "ok")
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if stream:
+            return self._chunks()
+        return Reply(self.text)
+
+    async def _chunks(self):
+        for piece in self.text.split(" "):
+            yield Reply(piece)
+
+
+def unavailable():
+    return 0, google_exceptions.ServiceUnavailable("down")
+
+
+@pytest.fixture(autouse=True)
+def fast_settings(monkeypatch):
+    # Each test runs its own event loop, so the stage semaphores must not carry over
+    monkeypatch.setattr(concurrency, "_semaphores", {})
+    monkeypatch.setattr(llm_client, "LLM_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_MIN_SAMPLES", 5)
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_MIN_DELAY", 0.05)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def collect(chunks):
+    return [piece async for piece in chunks]
+
+
+def test_retries_transient_errors():
+    model = FakeModel(unavailable(), (0, google_exceptions.BadGateway("502")))
+    assert run(LLMClient(model, "primary").generate("q")) == "SELECT 1"
+    assert model.calls == 3
+
+
+def test_attempt_timeout_is_retried():
+    model = FakeModel((1, "ok"))
+    client = LLMClient(model, "primary", attempt_timeout=0.05, hedge=False)
+    assert run(client.generate("q")) == "SELECT 1"
+    assert model.calls == 2
+
+
+def test_other_errors_are_not_retried():
+    model = FakeModel((0, ValueError("blocked prompt")))
+    with pytest.raises(ValueError):
+        run(LLMClient(model, "primary").generate("q"))
+    assert model.calls == 1
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(failures=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    run(asyncio.sleep(0.06))
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    run(asyncio.sleep(0.06))
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_open_circuit_fails_fast_without_calling_the_model():
+    model = FakeModel(*[unavailable()] * 3)
+    client = LLMClient(model, "primary", max_retries=2)
+    client.targets[0].breaker.failures = 3
+    with pytest.raises(LLMUnavailable):
+        run(client.generate("q"))
+    assert client.breaker_states() == {"primary": "open"}
+
+    with pytest.raises(LLMUnavailable, match="unavailable"):
+        run(client.generate("q"))
+    assert model.calls == 3
+
+
+def test_fallback_serves_while_the_primary_circuit_is_open():
+    primary = FakeModel(*[unavailable()] * 2)
+    fallback = FakeModel(text="SELECT 2")
+    client = LLMClient(primary, "primary", fallback, "fallback", max_retries=1)
+    client.targets[0].breaker.failures = 2
+
+    assert run(client.generate("q")) == "SELECT 2"
+    assert client.breaker_states() == {"primary": "open", "fallback": "closed"}
+    assert run(client.generate("q")) == "SELECT 2"
+    assert (primary.calls, fallback.calls) == (2, 2)
+
+
+def test_hedge_fires_once_the_first_request_passes_the_p95():
+    model = FakeModel(*[(0.001, "ok")] * 5, (2, "ok"), (0.001, "ok"))
+    client = LLMClient(model, "primary")
+    hedges = LLM_HEDGES._values.get(("primary",), 0)
+
+    async def scenario():
+        for _ in range(5):
+            await client.generate("q")
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await client.generate("q")
+        return loop.time() - started
+
+    assert run(scenario()) < 1
+    assert model.calls == 7
+    assert LLM_HEDGES._values[("primary",)] == hedges + 1
+
+
+def test_no_hedge_before_enough_samples():
+    model = FakeModel((0.1, "ok"))
+    client = LLMClient(model, "primary")
+    assert run(client.generate("q")) == "SELECT 1"
+    assert model.calls == 1
+
+
+def test_stream_retries_before_the_first_piece():
+    model = FakeModel(unavailable(), text="a b c")
+    assert run(collect(LLMClient(model, "primary").stream("q"))) == ["a", "b", "c"]
+    assert model.calls == 2
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_spent_deadline_does_not_charge_the_fallback(streaming):
+    primary = FakeModel((1, "ok"))
+    fallback = FakeModel()
+    client = LLMClient(primary, "primary", fallback, "fallback", deadline=0.1, hedge=False)
+    call = collect(client.stream("q")) if streaming else client.generate("q")
+    with pytest.raises(LLMUnavailable, match="within"):
+        run(call)
+    assert fallback.calls == 0
+    assert client.targets[1].breaker._consecutive == 0
@@ -0,0 +1,73 @@
+import asyncio
+from sql_cache import SQLCache, normalize_question
+
+
+def generator(results):
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return results[len(calls) - 1]
+
+    return generate, calls
+
+
+def test_normalize_question():
+    assert normalize_question("  Top   Customers?! ") == "top customers"
+
+
+def test_concurrent_misses_share_one_generation():
+    cache = SQLCache(path=None)
+    generate, calls = generator(["SELECT 1"])
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_generate("k", generate) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["SELECT 1"] * 5
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_disk_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    generate, calls = generator(["SELECT 1"])
+    asyncio.run(SQLCache(path=path).get_or_generate("k", generate))
+
+    restarted = SQLCache(path=path)
+    assert asyncio.run(restarted.get_or_generate("k", generate)) == "SELECT 1"
+    assert len(calls) == 1
+    assert restarted.stats()["hits"] == 1
+
+
+def test_discard_only_drops_the_failing_sql(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SQLCache(path=path)
+
+    async def scenario():
+        await cache.put("k", "SELECT 2")
+        await cache.discard("k", "SELECT 1")
+        kept = await cache.get("k")
+        await cache.discard("k", "SELECT 2")
+        return kept, await cache.get("k"), await SQLCache(path=path).get("k")
+
+    assert asyncio.run(scenario()) == ("SELECT 2", None, None)
+
+
+def test_expired_entries_are_not_served(tmp_path):
+    cache = SQLCache(ttl=0, path=str(tmp_path / "cache.db"))
+    generate, calls = generator(["SELECT 1", "SELECT 2"])
+
+    async def scenario():
+        await cache.get_or_generate("k", generate)
+        return await cache.get_or_generate("k", generate)
+
+    assert asyncio.run(scenario()) == "SELECT 2"
+
+
+def test_make_key_changes_with_examples_and_schema():
+    key = SQLCache.make_key("Q?", False, "v1", 10)
+    assert key == SQLCache.make_key("q", False, "v1", 10)
+    assert key != SQLCache.make_key("q", False, "v1", 11)
+    assert key != SQLCache.make_key("q", False, "v2", 10)
+    assert key != SQLCache.make_key("q", True, "v1", 10)
@@ -0,0 +1,136 @@
+import sqlite3
+import pytest
+from sql_guard import check_statement, review, QueryRejected
+
+
+class PlanConnection:
+    """Answers EXPLAIN with a fixed estimate; the LIMIT wrapper caps the rows"""
+
+    def __init__(self, rows=10, cost=100.0):
+        self.rows = rows
+        self.cost = cost
+        self.explained = []
+
+    def cursor(self):
+        return PlanCursor(self)
+
+
+class PlanCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.sql = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.sql = sql.removeprefix("EXPLAIN (FORMAT JSON) ")
+        self.conn.explained.append(self.sql)
+
+    def fetchone(self):
+        rows, cost = self.conn.rows, self.conn.cost
+        if "guarded_query LIMIT" in self.sql:
+            limit = int(self.sql.rsplit("LIMIT", 1)[1])
+            rows, cost = min(rows, limit), cost * limit / max(rows, 1)
+        return [[{"Plan": {"Total Cost": cost, "Plan Rows": rows}}]]
+
+
+@pytest.fixture
+def sqlite_db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INTEGER, note TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"row {i}") for i in range(50)])
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM t", "SELECT * FROM t"),
+    ("SELECT * FROM t;", "SELECT * FROM t"),
+    ("SELECT * FROM t ;; \n", "SELECT * FROM t"),
+    ("SELECT * FROM t -- note", "SELECT * FROM t"),
+    ("SELECT * FROM t; -- top rows", "SELECT * FROM t"),
+    ("SELECT * FROM t /* block */ ;", "SELECT * FROM t"),
+    ("WITH x AS (SELECT 1) SELECT * FROM x", "WITH x AS (SELECT 1) SELECT * FROM x"),
+    ("SELECT 1 -- inner\nFROM t", "SELECT 1 -- inner\nFROM t"),
+    ("SELECT '--not a comment' FROM t", "SELECT '--not a comment' FROM t"),
+])
+def test_check_statement_trims_trailing_noise(sql, expected):
+    assert check_statement(sql) == expected
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 'a; DROP TABLE t' FROM t",
+    "SELECT 'it''s; delete' FROM t",
+    "SELECT E'\\'; delete' FROM t",
+    'SELECT "delete" FROM t',
+    "SELECT $$; DROP TABLE t$$ FROM t",
+    "SELECT $fn$ insert into t $fn$ FROM t",
+    "SELECT 1 /* ; update t */ FROM t",
+    "SELECT 1 -- ; truncate t\nFROM t",
+])
+def test_check_statement_ignores_keywords_in_literals_and_comments(sql):
+    assert check_statement(sql)
+
+
+@pytest.mark.parametrize("sql, message", [
+    ("", "Empty"),
+    ("-- only a comment", "Empty"),
+    ("DELETE FROM t", "read-only"),
+    ("SELECT 1; DROP TABLE t", "single statement"),
+    ("SELECT 1; -- x\nSELECT 2", "single statement"),
+    ("WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d", "DELETE"),
+    ("SELECT * INTO copy_t FROM t", "INTO"),
+    ("SELECT * FROM t FOR UPDATE", "UPDATE"),
+    ("SELECT * FROM t FOR SHARE", "locking"),
+    ("SELECT pg_sleep(10)", "pg_sleep"),
+    ("SELECT pg_advisory_lock(1)", "pg_advisory_lock"),
+    ("SELECT $$x$$; DELETE FROM t", "single statement"),
+    ("SELECT E'\\'' ; DELETE FROM t", "single statement"),
+])
+def test_check_statement_rejects(sql, message):
+    with pytest.raises(QueryRejected, match=message):
+        check_statement(sql)
+
+
+def test_review_keeps_small_queries_as_they_are():
+    conn = PlanConnection(rows=10)
+    assert review(conn, "SELECT * FROM t;", max_rows=100) == "SELECT * FROM t"
+    assert len(conn.explained) == 1
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT id FROM t",
+    "SELECT id FROM t -- note",
+    "SELECT id FROM t; -- top rows",
+    "SELECT id FROM t /* trailing */",
+    "SELECT id FROM t WHERE note <> '-- x)'",
+])
+def test_review_wraps_large_queries_in_valid_sql(sqlite_db, sql):
+    conn = PlanConnection(rows=50)
+    guarded = review(conn, sql, max_rows=5)
+    assert guarded.endswith("AS guarded_query LIMIT 6")
+    assert len(sqlite_db.execute(guarded).fetchall()) == 6
+
+
+def test_review_refuses_large_queries_without_auto_limit():
+    with pytest.raises(QueryRejected, match="about 50 rows"):
+        review(PlanConnection(rows=50), "SELECT * FROM t", max_rows=5, auto_limit=False)
+
+
+def test_review_checks_cost_of_the_query_that_runs():
+    # Capping the rows brings the estimate under the limit
+    conn = PlanConnection(rows=1000, cost=1000.0)
+    assert "LIMIT 11" in review(conn, "SELECT * FROM t", max_rows=10, max_cost=100)
+    with pytest.raises(QueryRejected, match="too expensive"):
+        review(PlanConnection(rows=10, cost=1000.0), "SELECT * FROM t", max_rows=10, max_cost=100)
+
+
+def test_review_rejects_before_explaining():
+    conn = PlanConnection()
+    with pytest.raises(QueryRejected):
+        review(conn, "DROP TABLE t")
+    assert conn.explained == []